@@ -1,15 +1,26 @@
-from flask import Flask, send_from_directory
+from flask import Flask, g, send_from_directory
 from app.middleware.request_filter import RequestFilter
 from app.middleware.error_handler import ErrorHandler
 import logging
+import multiprocessing
 import os
+import time
 from config.settings import UPLOAD_FOLDER, TEMPLATE_FOLDER, STATIC_FOLDER
+from utils.json_serializer import FastJSONProvider
 
-def create_app():
+def create_app(start_jobs=True):
+    """
+    Build the Flask app
+
+    Args:
+        start_jobs: start the background job workers, off in processes that do not serve requests
+    """
 
     app = Flask(__name__,
                 static_folder=STATIC_FOLDER,
                 template_folder=TEMPLATE_FOLDER)
+    # jsonify and request.json through the fast serializer
+    app.json = FastJSONProvider(app)
     
     # 创建必要的文件夹
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -31,14 +42,27 @@ def create_app():
         return send_from_directory(TEMPLATE_FOLDER, 'index.html')
     
     # 注册路由蓝图
-    from app.routes import file_routes, analysis_routes, template_routes
+    from app.routes import file_routes, analysis_routes, template_routes, job_routes
     app.register_blueprint(file_routes.bp)
     app.register_blueprint(analysis_routes.bp)
     app.register_blueprint(template_routes.bp)
+    app.register_blueprint(job_routes.bp)
+
+    # Queued and interrupted jobs run from startup on. Child processes, such as the sandbox
+    # workers re-importing the entry script, never run jobs.
+    if start_jobs and multiprocessing.parent_process() is None:
+        job_routes.job_service.start()
     
+    @app.before_request
+    def before_request():
+        g.start_time = time.perf_counter()
+
     # 添加CORS支持
     @app.after_request
     def after_request(response):
+        # Time spent in the app, lets clients tell their HTTP overhead apart
+        if 'start_time' in g:
+            response.headers['X-Process-Time'] = f"{time.perf_counter() - g.start_time:.6f}"
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE')
@@ -5,9 +5,13 @@ from utils.logger import logger
 bp = Blueprint('analysis', __name__)
 analysis_service = AnalysisService()
 
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/jsonlines')
+
 @bp.route('/clean', methods=['POST'])
 def data_cleaning():
     try:
+        if request.mimetype in NDJSON_MIMETYPES:
+            return analysis_service.stream_cleaning(request.stream, request.args)
         return analysis_service.data_cleaning(request.json)
     except Exception as e:
         logger.error(f"Data cleaning failed: {str(e)}", exc_info=True)
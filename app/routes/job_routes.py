@@ -0,0 +1,22 @@
+from flask import Blueprint, request
+from app.services.analysis_service import AnalysisService
+from app.services.job_service import JobService
+
+bp = Blueprint('job', __name__)
+job_service = JobService(AnalysisService())
+
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    return job_service.submit(request.json or {})
+
+@bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    return job_service.list_jobs()
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_progress(job_id):
+    return job_service.get_progress(job_id)
+
+@bp.route('/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    return job_service.get_results(job_id)
@@ -11,3 +11,11 @@ def get_templates():
 @bp.route('/save_template', methods=['POST'])
 def save_template():
     return template_service.save_template(request.json)
+
+@bp.route('/template_history', methods=['GET'])
+def template_history():
+    return template_service.get_history()
+
+@bp.route('/restore_template', methods=['POST'])
+def restore_template():
+    return template_service.restore_template(request.json)
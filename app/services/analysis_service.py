@@ -1,11 +1,15 @@
-from flask import jsonify, request
-from utils.api_utils import api_request
+from flask import Response, jsonify, request
+from utils.api_utils import api_request_cached, api_request_stream
 from utils.logger import logger
 from utils.system_prompt import *
-from io import StringIO
-from utils.run_python_utils import TimeoutException, run_code, process_markdown_code, format_output, get_executed_python_code
+import tempfile
+from utils.run_python_utils import TimeoutException, get_executed_python_code
 from utils.prompt_template.codegen_prompt import merge_codegen_template_en
-from client.powerInstruct import run_single_data
+from utils.executor import BatchExecutor, execute_batch, batch_statistics, format_result_entry
+from utils.data_cleaner import CleaningRules, clean_records, clean_ndjson
+from utils.jsonl_dataset import load_dataset
+from utils import json_serializer
+from config.settings import CLEAN_SPOOL_MAX_MEMORY
 
 
 
@@ -18,26 +22,24 @@ logger = logging.getLogger(__name__)
 
 class AnalysisService:
     def __init__(self):
-        self.templates = load_user_templates()
+        self.template_store = get_template_store()
     
     # Data cleaning
     def data_cleaning(self, data):
         try:
             # Get JSON data
-            data = request.json or {}
+            data = data or {}
             raw_data = data.get('raw_data', [])
 
             if not isinstance(raw_data, list):
                 return jsonify({'code': 400, 'message': 'Invalid input format: raw_data should be a list'}), 400
 
-            cleaned_data = []
-            for item in raw_data:
-                if isinstance(item, dict):
-                    # Clean each dictionary item
-                    cleaned_item = {k: self.clean_value(v) for k, v in item.items()}
-                    cleaned_data.append(cleaned_item)
-                else:
-                    logger.warning(f"Skipping non-dict item: {item}")
+            try:
+                rules = CleaningRules.from_dict(data.get('rules'))
+            except ValueError as e:
+                return jsonify({'code': 400, 'message': str(e)}), 400
+
+            cleaned_data = self.clean_records(raw_data, rules)
 
             return jsonify({
                 'cleaned_data': cleaned_data,
@@ -48,71 +50,62 @@ class AnalysisService:
             logger.error(f"Data cleaning failed: {str(e)}", exc_info=True)
             return jsonify({'code': 500, 'message': str(e)}), 500
 
-    def clean_value(self, value):
-        """Clean a single value"""
-        if isinstance(value, str):
-            value = value.strip()           # Remove leading and trailing spaces
-            value = value.replace("\n", " ").replace("\r", "")  # Remove line breaks
-        elif isinstance(value, (int, float)):
-            pass        # The value type remains unchanged
-        elif value is None:
-            value = ""  # Replace None with an empty string
-        return value
+    def stream_cleaning(self, stream, params):
+        """
+        Clean an NDJSON upload and stream the cleaned records back as NDJSON
+
+        Args:
+            stream: binary request body, one JSON record per line, may be sent chunked
+            params: cleaning rules from the query string
+
+        Returns:
+            application/x-ndjson response with the record count in X-Record-Count
+        """
+        try:
+            rules = CleaningRules.from_dict(params)
+        except ValueError as e:
+            return jsonify({'code': 400, 'message': str(e)}), 400
+
+        # The whole upload is read before answering, clients that only read the response after
+        # sending their body would otherwise block. Only one chunk of records is in memory at a time.
+        spool = tempfile.SpooledTemporaryFile(max_size=CLEAN_SPOOL_MAX_MEMORY)
+        try:
+            count = clean_ndjson(stream, spool, rules)
+        except ValueError as e:
+            spool.close()
+            return jsonify({'code': 400, 'message': str(e)}), 400
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        logger.info(f"Cleaned {count} streamed records")
+
+        def generate():
+            try:
+                while True:
+                    block = spool.read(64 * 1024)
+                    if not block:
+                        break
+                    yield block
+            finally:
+                spool.close()
+
+        return Response(generate(), mimetype='application/x-ndjson', headers={'X-Record-Count': str(count)})
+
+    def clean_records(self, raw_data, rules=None):
+        """Clean a list of records in place, items that are not dicts are skipped"""
+        return clean_records(raw_data, rules)
 
     def analyze_fault(self, data):
         """Fault Analysis Interface"""
         try:
             # Record complete request data for debugging
-            logger.info(f"Received analysis request: {request.json}")
-            
-            # Get parameters from the request
-            data = request.json or {}
-            filepath = data.get('filepath', '')
-            file_content = data.get('file_content', '')
-            mode = data.get('mode', 'prompt')
-            template = data.get('template', '')
-            model_id = data.get('model_id', 'qwen2.5-7b-instruct')
-
-            logger.info(f"Analysis parameters - Mode: {mode}, File: {filepath}")
-            
-            # Read file contents
-            try:
-                logger.info(f"Reading file content from: {filepath}")
-                logger.info(f"File content read successfully, length: {len(file_content)}")
-            except Exception as e:
-                logger.error(f"File read error: {str(e)}")
-                return jsonify({
-                    'code': 500,
-                    'message': f'File read error: {str(e)}'
-                }), 500
-            
-            logger.info(f"Starting analysis with mode: {mode}")
-            logger.info(f"Model ID: {model_id}")
-
-            templates = load_user_templates()
-
-            if mode == 'prompt':
-                current_template = template or templates['prompt']
-                result = self._analyze_with_prompt(file_content=file_content, system_prompt=current_template, model_id=model_id)
-            elif mode == 'codegen':
-                current_template = template or templates['codegen']
-                result = self._analyze_with_codegen(file_content, codegen_prompt=current_template, model_id=model_id)
-            elif mode == 'prompt-codegen':
-                current_template = template if type(template) == str else templates['prompt']
-                result = self._analyze_with_prompt(file_content=file_content, system_prompt=current_template, model_id=model_id)
-            else:
-                logger.error(f"Unsupported analysis mode: {mode}")
-                result = {
-                    'error': f'Unsupported analysis mode: {mode}'
-                }
-
-            return jsonify({
-                'code': 200,
-                'ai_response': result.get('ai_response', ''),
-                'mode': mode,
-                'token_prompt': result.get('token_prompt', ''),
-                'token_compli': result.get('token_compli', '')
-            })
+            logger.info(f"Received analysis request: {data}")
+            data = data or {}
+            if data.get('stream', False):
+                return Response(self._stream_analysis(data), mimetype='text/event-stream',
+                                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            return jsonify(self.run_analysis(data))
         
         except Exception as e:
             logger.error(f"Analysis failed: {str(e)}")
@@ -120,106 +113,124 @@ class AnalysisService:
                 'code': 500,
                 'message': str(e)
             }), 500
+
+    def run_analysis(self, data):
+        """Run one analysis request and return its response payload, shared by /analyze and the batch jobs"""
+        # Get parameters from the request
+        filepath = data.get('filepath', '')
+        file_content = data.get('file_content', '')
+        mode = data.get('mode', 'prompt')
+        template = data.get('template', '')
+        model_id = data.get('model_id', 'qwen2.5-7b-instruct')
+        use_cache = bool(data.get('use_cache', True))
+
+        logger.info(f"Analysis parameters - Mode: {mode}, File: {filepath}")
+        logger.info(f"File content length: {len(file_content)}")
+        logger.info(f"Starting analysis with mode: {mode}")
+        logger.info(f"Model ID: {model_id}")
+
+        current_template = self._select_template(mode, template)
+
+        if mode == 'prompt':
+            result = self._analyze_with_prompt(file_content=file_content, system_prompt=current_template, model_id=model_id, use_cache=use_cache)
+        elif mode == 'codegen':
+            result = self._analyze_with_codegen(file_content, codegen_prompt=current_template, model_id=model_id, use_cache=use_cache)
+        elif mode == 'prompt-codegen':
+            result = self._analyze_with_prompt(file_content=file_content, system_prompt=current_template, model_id=model_id, use_cache=use_cache)
+        else:
+            logger.error(f"Unsupported analysis mode: {mode}")
+            result = {
+                'error': f'Unsupported analysis mode: {mode}'
+            }
+
+        return {
+            'code': 200,
+            'ai_response': result.get('ai_response', ''),
+            'mode': mode,
+            'token_prompt': result.get('token_prompt', ''),
+            'token_compli': result.get('token_compli', ''),
+            'cached': result.get('cached', False)
+        }
             
-    def execute_code(self, data):
+    def _select_template(self, mode, template):
+        """Template of an analysis request, the user's one or the default of its mode"""
+        templates, _ = self.template_store.get()
+        if mode == 'prompt':
+            return template or templates['prompt']
+        if mode == 'codegen':
+            return template or templates['codegen']
+        if mode == 'prompt-codegen':
+            return template if type(template) == str else templates['prompt']
+        return None
+
+    def _build_prompt(self, mode, template, file_content):
+        """Final prompt sent to the model"""
+        if mode == 'codegen':
+            return template + file_content
+        # The web UI sends {'prompt': ..., 'codegen': ...}, the pipeline client a plain string
+        return str(template['prompt'] if isinstance(template, dict) else template) + file_content
+
+    def _stream_analysis(self, data):
+        """
+        Stream an analysis as server-sent events
+
+        `delta` events carry the text as the model generates it. The last event is `done` with
+        the same payload as a non-streaming /analyze response, or `error` if the request failed.
+        """
+        def event(name, payload):
+            return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        mode = data.get('mode', 'prompt')
+        model_id = data.get('model_id', 'qwen2.5-7b-instruct')
         try:
-            code = request.json.get('code', '')             # Code in markdown format
-            input_path = request.json.get('input_path', '') # Input data path
-            print("Code: ", code)
-            print("Input path: ", input_path)
-            logger.debug(f"Original code: {code}")
-            logger.debug(f"Input path: {input_path}")
-            final_code = process_markdown_code(code, input_path)
-            logger.debug(f"Processed code: {final_code}")
-            # Capture output
-            output = StringIO()
-            # Execute code
-            try:
-                result = run_code(code=final_code, output=output)
-                logger.debug(f"Code execution result: {result}")
-            except Exception as e:
-                logger.error(f"Code execution error: {str(e)}")
-                raise
-
-            stdout_content = output.getvalue()
-            logger.debug(f"Stdout content: {stdout_content}")
-            
-            formatted_output = format_output(result)
-            logger.debug(f"Formatted output: {formatted_output}")
-            
-            
-            return jsonify({
-                'code': 200,
-                'success': True,
-                'result': str(formatted_output),
-                'stdout': stdout_content,
-                'executed_code': final_code
-            })
-            
-        except TimeoutException as e:
-            return jsonify({
-                'code': 500,
-                'success': False,
-                'error': 'Code execution timeout'
-            })
+            template = self._select_template(mode, data.get('template', ''))
+            if template is None:
+                raise ValueError(f'Unsupported analysis mode: {mode}')
+            final_prompt = self._build_prompt(mode, template, data.get('file_content', ''))
+            logger.info(f"Starting streaming {mode} analysis with model {model_id}")
+
+            for chunk in api_request_stream(final_prompt, model_name=model_id,
+                                            use_cache=bool(data.get('use_cache', True))):
+                if chunk['type'] == 'delta':
+                    yield event('delta', {'content': chunk['content']})
+                    continue
+                logger.info(f"Input token: {chunk['token_prompt']}")
+                logger.info(f"Output token: {chunk['token_compli']}")
+                yield event('done', {
+                    'code': 200,
+                    'ai_response': chunk['response'],
+                    'mode': mode,
+                    'token_prompt': chunk['token_prompt'],
+                    'token_compli': chunk['token_compli'],
+                    'cached': chunk['cached']
+                })
         except Exception as e:
-            return jsonify({
-                'code': 500,
-                'success': False,
-                'error': str(e),
-                'executed_code': final_code if 'final_code' in locals() else None
-            })
-        
+            logger.error(f"Streaming analysis failed: {str(e)}")
+            yield event('error', {'code': 500, 'message': str(e)})
+
+    def load_batch(self, data):
+        """Extract the generated code and load the records of an /execute request"""
+        raw_code = data.get('code', '')
+        batch_data_path = data.get('input_path', '')
+        executed_code = get_executed_python_code(raw_code)
+        batch_data = load_dataset(batch_data_path)
+        return executed_code, batch_data
+
     def execute_batch(self, data):
         try:
-            raw_code = request.json.get('code', '')
-            batch_data_path = request.json.get('input_path', '')
-            executed_code = get_executed_python_code(raw_code)
-            with open(batch_data_path, "r", encoding='utf-8') as f:
-                batch_data = json.load(f)
-            
-            success_results = []
-            failed_results = []
-            total = len(batch_data)
-            success_count = 0
-            failure_count = 0
-            
-            
-            for i, data in enumerate(batch_data):
-                try:
-                    result = run_single_data(executed_code=executed_code, input_data=data)
-                    success_results.append({
-                        "index": i-1,
-                        "input": data,
-                        "result": result
-                    })
-                    success_count += 1
-                except Exception as e:
-                    failure_count += 1
-                    error_info = {
-                        "index": i-1,
-                        "input": data,
-                        "error": str(e),
-                        "error_type": type(e).__name__
-                    }
-                    failed_results.append(error_info)
-                    logger.error(f"Failed to process the {i}th data: {str(e)}")
-                    continue  # 继续处理下一条数据
-                    # 统计信息
-            
-            statistics = {
-                "total": total,
-                "success": success_count,
-                "failure": failure_count,
-                "success_rate": f"{(success_count/total)*100:.2f}%"
-            }
+            data = data or {}
+            executed_code, batch_data = self.load_batch(data)
+
+            use_cache = bool(data.get('use_cache', True))
 
+            if data.get('stream', False):
+                return Response(self._stream_batch(executed_code, batch_data, use_cache), mimetype='application/x-ndjson')
+            
             # Save the final result
-            final_results = {
-                "success_results": success_results,
-                "failed_results": failed_results,
-                "statistics": statistics
-            }
+            final_results = execute_batch(executed_code, batch_data, use_cache=use_cache)
+            for entry in final_results["success_results"]:
+                format_result_entry(entry)
+            statistics = final_results["statistics"]
             return jsonify({
                     'code': 200,
                     'success': True,
@@ -240,18 +251,43 @@ class AnalysisService:
                 'executed_code': executed_code if 'executed_code' in locals() else None
             })
 
-    def _analyze_with_prompt(self, file_content, system_prompt, model_id):
+    def _stream_batch(self, executed_code, batch_data, use_cache=True):
+        """
+        Stream batch results as NDJSON
+
+        One line per record is emitted as soon as it completes, in input order, with a
+        `status` of "success" or "failed". The last line holds the batch `statistics`.
+        """
+        success_count = 0
+        failure_count = 0
+        try:
+            for entry in BatchExecutor(executed_code, use_cache=use_cache).iter_results(batch_data):
+                if 'error' in entry:
+                    failure_count += 1
+                    entry['status'] = 'failed'
+                else:
+                    success_count += 1
+                    entry['status'] = 'success'
+                    format_result_entry(entry)
+                yield json_serializer.dumps(entry) + '\n'
+
+            statistics = batch_statistics(len(batch_data), success_count, failure_count)
+            yield json_serializer.dumps({'statistics': statistics}) + '\n'
+        except Exception as e:
+            logger.error(f"Batch streaming failed: {str(e)}")
+            yield json_serializer.dumps({'success': False, 'error': str(e)}) + '\n'
+
+    def _analyze_with_prompt(self, file_content, system_prompt, model_id, use_cache=True):
         """
         Prompt mode analysis
         :param content: file content
         :param system_prompt: system prompt words
         :return: analysis results
         """
-        system_prompt = str(system_prompt['prompt'])
-        final_prompt = system_prompt + file_content
+        final_prompt = self._build_prompt('prompt', system_prompt, file_content)
         try:
-            logger.info(f"Starting prompt analysis \nSystem prompt length: {len(system_prompt)} \Content length: {len(file_content)}")
-            messages, token_prompt, token_compli = api_request(prompt=final_prompt, model_name=model_id)
+            logger.info(f"Starting prompt analysis \nSystem prompt length: {len(final_prompt) - len(file_content)} \Content length: {len(file_content)}")
+            messages, token_prompt, token_compli, cached = api_request_cached(prompt=final_prompt, model_name=model_id, use_cache=use_cache)
             # Implement specific prompt analysis logic
             logger.info("Analysis completed successfully")
             result = {
@@ -261,7 +297,8 @@ class AnalysisService:
                 'content_length': len(final_prompt),
                 'ai_response': messages,
                 'token_prompt': token_prompt,
-                'token_compli': token_compli
+                'token_compli': token_compli,
+                'cached': cached
             }
             logger.info(f"Analysis result: {messages}")
             logger.info(f"Input token: {token_prompt}")
@@ -272,19 +309,19 @@ class AnalysisService:
         except Exception as e:
             return {'error': str(e)}
 
-    def _analyze_with_codegen(self, file_content, codegen_prompt, model_id):
+    def _analyze_with_codegen(self, file_content, codegen_prompt, model_id, use_cache=True):
         """
         CodeGen mode analysis
         :param content: file content
         :param template: generated template
         :return: analysis results
         """
-        final_prompt = codegen_prompt + file_content
+        final_prompt = self._build_prompt('codegen', codegen_prompt, file_content)
         try:
             # Implement specific CodeGen analysis logic
             logger.info(f"Starting codegen analysis \nSystem prompt length: {len(codegen_prompt)} \Content length: {len(file_content)}")
             
-            messages, token_prompt, token_compli = api_request(prompt=final_prompt, model_name=model_id)
+            messages, token_prompt, token_compli, cached = api_request_cached(prompt=final_prompt, model_name=model_id, use_cache=use_cache)
             logger.info("Analysis completed successfully")
             result = {
                 'mode': 'codegen',
@@ -293,7 +330,8 @@ class AnalysisService:
                 'content_length': len(final_prompt),
                 'ai_response': messages,
                 'token_prompt': token_prompt,
-                'token_compli': token_compli
+                'token_compli': token_compli,
+                'cached': cached
             }
             logger.info(f"Analysis result: {messages}")
             logger.info(f"Input token: {token_prompt}")
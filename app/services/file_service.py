@@ -1,10 +1,11 @@
 from flask import Flask, request, jsonify
 import os, json
 from pathlib import Path
-import zipfile
-from config.settings import UPLOAD_FOLDER, DATA_FOLDER
+from config.settings import UPLOAD_FOLDER, DATA_FOLDER, JSON_CONTENT_MAX_LIMIT
 from utils.file_utils import allowed_single_file, generate_unique_filename
 from utils.logger import logger
+from utils.zip_ingest import ingest_zip
+from utils.record_index import get_record_index, project
 from utils.file_utils import *
 
 class FileService:
@@ -63,23 +64,6 @@ class FileService:
             file = request.files['file']
             if file.filename == '':
                 return jsonify({'success': False, 'error': 'No selected file'})
-            def decode_zip_filename(name):
-                encodings = ['utf-8', 'gbk', 'gb18030', 'cp936']
-                raw_bytes = name.encode('cp437')
-                
-                for encoding in encodings:
-                    try:
-                        decoded = raw_bytes.decode(encoding)
-                        return decoded
-                    except:
-                        continue
-                return name
-
-            def is_system_file(filename):
-                return (filename.startswith('__MACOSX') or 
-                    filename.startswith('._') or 
-                    filename.startswith('.') or 
-                    '.DS_Store' in filename)
 
             if file and allowed_zip_file(file.filename):
                 # Get the original file extension
@@ -90,88 +74,46 @@ class FileService:
                 unique_filename = generate_unique_filename(original_filename, existing_extension=original_extension)
                 # Build the save path
                 save_zip_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                folder_name = Path(save_zip_path).stem
-                save_path = os.path.join(os.path.dirname(save_zip_path), folder_name)
 
                 file.save(save_zip_path)
                 logger.info(f"File successfully saved: {save_zip_path}")
 
-                extracted_files = []
+                all_files_path = self._merged_data_path(unique_filename)
+                # Members are parsed straight from the archive, nothing is extracted to disk
+                extracted_files = ingest_zip(save_zip_path, all_files_path)
 
-                with zipfile.ZipFile(save_zip_path, 'r') as zip_ref:
-                    for name in zip_ref.namelist():
-                        try:
-                            
-                            real_name = decode_zip_filename(name)
-                            if is_system_file(real_name):
-                                continue
-                            if not real_name.lower().endswith(('.json', '.xml', '.txt')):
-                                continue
-                            extract_path = os.path.join(save_path, real_name)
-                            os.makedirs(os.path.dirname(extract_path), exist_ok=True)
-                            with zip_ref.open(name) as source, open(extract_path, 'wb') as target:
-                                target.write(source.read())
-
-                            if os.path.isfile(extract_path):
-                                extracted_files.append({
-                                    'name': real_name,
-                                    'path': extract_path,
-                                    'relative_path': os.path.relpath(extract_path, save_path),
-                                    'gt': real_name.split('/')[1]
-                                })
-                            
-                        except Exception as e:
-                            print(f"Error processing {name}: {str(e)}")
-                            continue
-                
                 if not extracted_files:
+                    if os.path.exists(all_files_path):
+                        os.remove(all_files_path)
                     return jsonify({
                         'success': False,
                         'error': 'No valid files found in archive'
                     })
-                
-                all_files, all_files_path = self._merge_train_data(extracted_files, unique_filename)
 
                 return jsonify({
                     'success': True,
                     'message': f'Successfully extracted {len(extracted_files)} files',
                     'unique_filename': unique_filename,
                     'original_filename': original_filename,
-                    'save_path': save_path,
-                    'file_size': os.path.getsize(save_path),
+                    # Nothing is extracted, the stored archive is the saved upload
+                    'save_path': save_zip_path,
+                    'file_size': os.path.getsize(save_zip_path),
                     'files': extracted_files,
                     'all_files_path': all_files_path
                 }), 200
 
         except Exception as e:
+            logger.error(f"Zip upload failed: {str(e)}", exc_info=True)
             return jsonify({
                 'success': False,
                 'error': str(e)
             })
 
-    def _merge_train_data(self, extracted_files, unique_zipname):
-        try:
-            root_path = os.path.join(DATA_FOLDER, 'test_data')
-            os.makedirs(root_path, exist_ok=True)
-
-            total_json_file = []
-            for file in extracted_files:
-                if file['name'].endswith('.json'):
-                    with open(file['path'], 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        data['gt'] = file['gt']
-                        total_json_file.append(data)
-            unique_zipname = unique_zipname.split('.')[0]
-            with open(os.path.join(root_path, f'{unique_zipname}.json'), 'w', encoding='utf-8') as f:
-                json.dump(total_json_file, f, ensure_ascii=False, indent=4)
-            
-            total_json_path = os.path.join(root_path, f'{unique_zipname}.json')
-            return total_json_file, total_json_path
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'error': str(e)
-            })
+    def _merged_data_path(self, unique_zipname):
+        """Where the records of a zip upload are merged into one dataset"""
+        root_path = os.path.join(DATA_FOLDER, 'test_data')
+        unique_zipname = unique_zipname.split('.')[0]
+        return os.path.join(root_path, f'{unique_zipname}.json')
         
     def handle_file_deletion(self, file_path):
         """Delete the route of the specified file"""
@@ -242,16 +184,45 @@ class FileService:
                     'message': f'File not found: {file_path}'
                 }), 404
 
+            paged = 'offset' in request.args or 'limit' in request.args
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
+                offset = int(request.args.get('offset', 0))
+                limit = min(int(request.args.get('limit', JSON_CONTENT_MAX_LIMIT)), JSON_CONTENT_MAX_LIMIT)
+            except ValueError:
+                offset = limit = -1
+            if offset < 0 or limit < 0:
+                return jsonify({
+                    'code': 400,
+                    'message': 'offset and limit must be non-negative integers'
+                }), 400
+            fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+
+            try:
+                index = get_record_index(file_path)
+                if index is None:
+                    # Not a list of records, served whole
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    return jsonify({
+                        'code': 200,
+                        'data': project(data, fields)
+                    })
+
+                total = len(index)
+                if not paged:
+                    # Whole dataset, kept for older clients
+                    offset, limit = 0, total
+                data = [project(record, fields) for record in index.read(offset, limit)]
                 return jsonify({
                     'code': 200,
-                    'data': data
+                    'data': data,
+                    'total': total,
+                    'offset': offset,
+                    'limit': limit,
+                    'has_more': offset + len(data) < total
                 })
                 
-            except json.JSONDecodeError:
+            except ValueError:
                 return jsonify({
                     'code': 400,
                     'message': 'Invalid JSON file'
@@ -267,4 +238,4 @@ class FileService:
             return jsonify({
                 'code': 500,
                 'message': f'Server error: {str(e)}'
-            }), 500
\ No newline at end of file
+            }), 500
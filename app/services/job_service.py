@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import queue
+import threading
+from flask import jsonify, send_file
+from config.settings import JOB_FOLDER, JOB_WORKERS, JOB_QUEUE_SIZE
+from utils.executor import BatchExecutor, batch_statistics, format_result_entry
+from utils import json_serializer
+from utils.logger import logger
+
+JOB_TYPES = ('execute', 'analyze')
+# Seconds between two writes of the progress of a running job
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class JobService:
+    """
+    Background batch jobs with progress polling
+
+    A job wraps an /execute or /analyze request. Jobs wait in a bounded queue and are run
+    by a few background threads. The state of every job is saved to JOB_FOLDER, so after
+    a server restart finished jobs can still be fetched and unfinished ones run again.
+    Results are written as NDJSON, in the same format as the streaming mode of /execute.
+    """
+    def __init__(self, analysis_service):
+        self.analysis_service = analysis_service
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+        self.started = False
+        os.makedirs(JOB_FOLDER, exist_ok=True)
+        self._load_jobs()
+
+    def start(self):
+        """Start the background workers and requeue the jobs interrupted by the last shutdown"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            unfinished = sorted((job for job in self.jobs.values() if job['status'] in ('queued', 'running')),
+                                key=lambda job: job['created_at'])
+
+        for job in unfinished:
+            self._reset_progress(job)
+            try:
+                self.queue.put_nowait(job['job_id'])
+                logger.info(f"Requeued job {job['job_id']} after restart")
+            except queue.Full:
+                self._finish(job, 'failed', error='Job queue is full')
+
+        for i in range(JOB_WORKERS):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, data):
+        try:
+            job_type = data.get('type', 'execute')
+            if job_type not in JOB_TYPES:
+                return jsonify({
+                    'code': 400,
+                    'message': f'Unsupported job type: {job_type}'
+                }), 400
+
+            job_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}"
+            job = {
+                'job_id': job_id,
+                'type': job_type,
+                'payload': data.get('payload', {}),
+                'status': 'queued',
+                'created_at': time.time(),
+                'error': None
+            }
+            self._reset_progress(job)
+
+            if self.queue.full():
+                return jsonify({
+                    'code': 503,
+                    'message': 'Job queue is full, please retry later'
+                }), 503
+
+            with self.lock:
+                self.jobs[job_id] = job
+            self._save(job)
+            try:
+                self.queue.put_nowait(job_id)
+            except queue.Full:
+                self._finish(job, 'failed', error='Job queue is full')
+                return jsonify({
+                    'code': 503,
+                    'message': 'Job queue is full, please retry later'
+                }), 503
+
+            logger.info(f"Submitted {job_type} job {job_id}")
+            return jsonify({
+                'code': 200,
+                'job_id': job_id,
+                'status': 'queued'
+            })
+        except Exception as e:
+            logger.error(f"Failed to submit job: {str(e)}")
+            return jsonify({
+                'code': 500,
+                'message': str(e)
+            }), 500
+
+    def list_jobs(self):
+        with self.lock:
+            jobs = [self._view(job) for job in self.jobs.values()]
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jsonify({
+            'code': 200,
+            'jobs': jobs
+        })
+
+    def get_progress(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            view = self._view(job) if job else None
+        if view is None:
+            return jsonify({
+                'code': 404,
+                'message': f'Job not found: {job_id}'
+            }), 404
+        return jsonify({
+            'code': 200,
+            'job': view
+        })
+
+    def get_results(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            status = job['status'] if job else None
+        if job is None:
+            return jsonify({
+                'code': 404,
+                'message': f'Job not found: {job_id}'
+            }), 404
+        if status != 'completed':
+            return jsonify({
+                'code': 409,
+                'status': status,
+                'message': f'Job is not completed: {status}'
+            }), 409
+        return send_file(self._results_path(job_id), mimetype='application/x-ndjson')
+
+    def _worker(self):
+        while True:
+            job_id = self.queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is not None:
+                    self._run_job(job)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                self._finish(job, 'failed', error=str(e))
+            finally:
+                self.queue.task_done()
+
+    def _run_job(self, job):
+        with self.lock:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+        self._save(job)
+
+        with open(self._results_path(job['job_id']), 'w', encoding='utf-8') as f:
+            if job['type'] == 'execute':
+                self._run_execute(job, f)
+            else:
+                self._run_analyze(job, f)
+        self._finish(job, 'completed')
+
+    def _run_execute(self, job, f):
+        """Run an /execute request, built on the same batch executor"""
+        executed_code, batch_data = self.analysis_service.load_batch(job['payload'])
+        with self.lock:
+            job['total'] = len(batch_data)
+
+        use_cache = bool(job['payload'].get('use_cache', True))
+        last_save = time.monotonic()
+        for entry in BatchExecutor(executed_code, use_cache=use_cache).iter_results(batch_data):
+            entry['status'] = 'failed' if 'error' in entry else 'success'
+            f.write(json_serializer.dumps(format_result_entry(entry)) + '\n')
+            with self.lock:
+                job['processed'] += 1
+                job['failed' if 'error' in entry else 'succeeded'] += 1
+            if time.monotonic() - last_save >= PROGRESS_SAVE_INTERVAL:
+                self._save(job)
+                last_save = time.monotonic()
+
+        statistics = batch_statistics(job['total'], job['succeeded'], job['failed'])
+        f.write(json_serializer.dumps({'statistics': statistics}) + '\n')
+
+    def _run_analyze(self, job, f):
+        """Run an /analyze request"""
+        with self.lock:
+            job['total'] = 1
+        result = self.analysis_service.run_analysis(job['payload'])
+        f.write(json_serializer.dumps(result) + '\n')
+        with self.lock:
+            job['processed'] = 1
+            job['succeeded' if result.get('ai_response') else 'failed'] = 1
+
+    def _finish(self, job, status, error=None):
+        with self.lock:
+            job['status'] = status
+            job['error'] = error
+            job['finished_at'] = time.time()
+        self._save(job)
+
+    def _reset_progress(self, job):
+        job.update({
+            'status': 'queued',
+            'total': None,
+            'processed': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'started_at': None,
+            'finished_at': None
+        })
+
+    def _view(self, job):
+        """Public state of a job, with the estimated remaining time of a running one"""
+        view = {k: v for k, v in job.items() if k != 'payload'}
+        eta = None
+        if job['status'] == 'running' and job['processed'] and job['total']:
+            elapsed = time.time() - job['started_at']
+            eta = round(elapsed / job['processed'] * (job['total'] - job['processed']), 1)
+        elif job['status'] == 'completed':
+            eta = 0
+        view['eta_seconds'] = eta
+        return view
+
+    def _job_path(self, job_id):
+        return os.path.join(JOB_FOLDER, f'{job_id}.json')
+
+    def _results_path(self, job_id):
+        return os.path.join(JOB_FOLDER, f'{job_id}.results.ndjson')
+
+    def _save(self, job):
+        """Write the job state atomically, so a restart never sees a partial file"""
+        with self.lock:
+            content = json.dumps(job, ensure_ascii=False)
+        path = self._job_path(job['job_id'])
+        tmp_path = f'{path}.tmp'
+        with self.save_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+    def _load_jobs(self):
+        for filename in os.listdir(JOB_FOLDER):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(JOB_FOLDER, filename), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+                self.jobs[job['job_id']] = job
+            except Exception as e:
+                logger.error(f"Failed to load job {filename}: {str(e)}")
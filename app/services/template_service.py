@@ -1,23 +1,22 @@
 from flask import jsonify
 from utils.logger import logger
 from config.settings import TEMPLATE_FILE
-from utils.system_prompt import load_user_templates, save_user_templates
+from utils.system_prompt import TEMPLATE_TYPES, get_template_store
 
 class TemplateService:
     def __init__(self):
-        self.default_templates = load_user_templates()
+        self.store = get_template_store()
 
 
     def get_templates(self):
         try:
-            user_templates = load_user_templates() 
-            if not user_templates:
-                user_templates = self.default_templates
+            templates, version = self.store.get()
 
             return jsonify({
                 'code': 200,
                 'success': True,
-                'templates': user_templates
+                'templates': templates,
+                'version': version
             })
         except Exception as e:
             logger.error(f"Failed to load templates: {str(e)}", exc_info=True)
@@ -49,32 +48,78 @@ class TemplateService:
         try:
             template_content = data.get('content', '')
             template_type = data.get('type', 'prompt')
+            # The prompt-codegen mode saves both templates at once
+            if template_type == 'prompt-codegen' and isinstance(template_content, dict):
+                updates = {key: template_content.get(key, '') for key in TEMPLATE_TYPES}
+            else:
+                updates = {template_type: template_content}
 
-            is_valid, error_message = self.validate_template(template_type, template_content)
-            if not is_valid:
-                return jsonify({
-                    'code': 400,
-                    'success': False,
-                    'message': f'Template validation failed: {error_message}'
-                })
+            for key, content in updates.items():
+                if key not in TEMPLATE_TYPES:
+                    return jsonify({
+                        'code': 400,
+                        'success': False,
+                        'message': f'Unknown template type: {key}'
+                    })
+                is_valid, error_message = self.validate_template(key, content)
+                if not is_valid:
+                    return jsonify({
+                        'code': 400,
+                        'success': False,
+                        'message': f'Template validation failed: {error_message}'
+                    })
 
-            templates = load_user_templates()
-            templates[template_type] = template_content
+            version = self.store.save(updates)
+            return jsonify({
+                'code': 200,
+                'success': True,
+                'message': 'Template saved successfully',
+                'version': version
+            })
+        except Exception as e:
+            logger.error(f"Failed to save template: {str(e)}", exc_info=True)
+            return jsonify({
+                'code': 500,
+                'success': False,
+                'error': str(e)
+            })
 
-            if save_user_templates(templates):
-                return jsonify({
-                    'code': 200,
-                    'success': True,
-                    'message': 'Template saved successfully'
-                })
-            else:
+    def get_history(self):
+        try:
+            return jsonify({
+                'code': 200,
+                'success': True,
+                'history': self.store.history()
+            })
+        except Exception as e:
+            logger.error(f"Failed to load template history: {str(e)}", exc_info=True)
+            return jsonify({
+                'code': 500,
+                'success': False,
+                'error': str(e)
+            })
+
+    def restore_template(self, data):
+        try:
+            data = data or {}
+            template_type = data.get('type', 'prompt')
+            version = data.get('version', '')
+            try:
+                new_version = self.store.restore(template_type, version)
+            except KeyError as e:
                 return jsonify({
-                    'code': 500,
+                    'code': 404,
                     'success': False,
-                    'error': 'Failed to save template'
+                    'message': e.args[0]
                 })
+            return jsonify({
+                'code': 200,
+                'success': True,
+                'message': 'Template restored successfully',
+                'version': new_version
+            })
         except Exception as e:
-            logger.error(f"Failed to save template: {str(e)}", exc_info=True)
+            logger.error(f"Failed to restore template: {str(e)}", exc_info=True)
             return jsonify({
                 'code': 500,
                 'success': False,
@@ -0,0 +1,80 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Any
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client.benchmark_pipeline import make_records
+from utils import json_serializer
+
+# Serialization benchmark of the result payloads: the json module as used before against the
+# serializer in utils/json_serializer.py (orjson when installed).
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark JSON serialization of batch results')
+    parser.add_argument('--records', type=int, default=20000, help='Number of synthetic batch results')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the best one is reported')
+    return parser.parse_args()
+
+def make_batch_results(count: int) -> Dict[str, Any]:
+    """Batch results shaped like the output of execute_batch"""
+    success_results = []
+    for index, record in enumerate(make_records(count)):
+        output = {'Fault classification': record['gt'], 'Analysis conclusion': '故障相电压低于55V。' * 3}
+        success_results.append({
+            'index': index,
+            'input': record,
+            'result': {'success': True, 'result': json.dumps({'input': str(record), 'output': str(output)},
+                                                            ensure_ascii=False, indent=4)},
+        })
+    return {'success_results': success_results, 'failed_results': [],
+            'statistics': {'total': count, 'success': count, 'failure': 0, 'success_rate': '100.00%'}}
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark():
+    args = parse_args()
+    results = make_batch_results(args.records)
+    items: List[Any] = results['success_results']
+    tmp_dir = tempfile.mkdtemp(prefix='powerinstruct_json_')
+    path = os.path.join(tmp_dir, 'results.json')
+
+    def stdlib_file():
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    def stream_file():
+        with json_serializer.JsonArrayWriter(path) as writer:
+            writer.write_many(items)
+
+    cases = [
+        ('response (jsonify)', lambda: json.dumps(results, sort_keys=True, separators=(',', ':')),
+         lambda: json_serializer.dumps(results, sort_keys=True)),
+        ('results file', stdlib_file, lambda: json_serializer.dump(results, path)),
+        ('results file, streamed array', stdlib_file, stream_file),
+    ]
+
+    print(f"{args.records} batch results, serializer backend: {json_serializer.get_backend()}")
+    print(f"{'case':<32}{'json module':>14}{'serializer':>14}{'speedup':>10}")
+    for name, baseline, candidate in cases:
+        before = best_time(baseline, args.repeat)
+        after = best_time(candidate, args.repeat)
+        print(f"{name:<32}{before:>13.3f}s{after:>13.3f}s{before / after:>9.1f}x")
+    os.remove(path)
+    os.rmdir(tmp_dir)
+
+
+if __name__ == '__main__':
+    benchmark()
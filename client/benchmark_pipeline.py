@@ -0,0 +1,234 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Dict, List, Any
+import requests
+from werkzeug.serving import make_server
+
+# Add the project root directory to the Python path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from client.mock_llm_server import MockConfig, create_mock_app
+from utils.jsonl_dataset import convert_json_to_jsonl
+
+# End-to-end benchmark of /analyze and the power_instruct loop against the local mock LLM server,
+# so the numbers only depend on this code and the configured mock latency.
+
+FAULT_TYPES = ['A_fault', 'B_fault', 'C_fault', 'AB_fault', 'AC_fault', 'BC_fault']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the PowerInstruct pipeline against a mock LLM')
+    parser.add_argument('--records', type=int, default=200, help='Number of synthetic records')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of pipeline runs')
+    parser.add_argument('--analyze_requests', type=int, default=50, help='Number of /analyze requests')
+    parser.add_argument('--analyze_concurrency', type=int, default=8, help='Concurrent /analyze requests')
+    parser.add_argument('--model_datagen', type=str, default='qwen-max')
+    parser.add_argument('--model_codegen', type=str, default='qwen-coder-plus')
+    parser.add_argument('--max_iterations', type=int, default=5)
+    parser.add_argument('--num_candidates', type=int, default=1)
+    parser.add_argument('--beam_width', type=int, default=1)
+    parser.add_argument('--early_stop_confidence', type=float, default=0.0)
+    parser.add_argument('--early_stop_min_records', type=int, default=20)
+    parser.add_argument('--data_format', type=str, default='json', choices=['json', 'jsonl'],
+                        help='Write the synthetic records as a JSON array or an indexed JSONL dataset')
+    parser.add_argument('--backends', type=str, default='http',
+                        help='Comma separated pipeline backends to compare, e.g. http,local')
+    parser.add_argument('--output_dir', type=str, default=None, help='Defaults to a temporary directory')
+    defaults = MockConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f'--{name}', type=type(value) if value is not None else int, default=value,
+                            help='Mock LLM setting')
+    return parser.parse_args()
+
+def make_records(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Synthetic fault records whose faulted phases have a voltage below 55V, labelled in `gt`"""
+    rng = random.Random(seed)
+
+    def wave(faulted=''):
+        values = {}
+        for phase in 'ABC':
+            low = phase in faulted
+            values[f"I{phase.lower()}"] = f"{rng.uniform(5, 60) if low else rng.uniform(0.1, 1.5):.3f}"
+            values[f"U{phase.lower()}"] = f"{rng.uniform(15, 45) if low else rng.uniform(57, 65):.3f}"
+        values['I0'] = f"{rng.uniform(1, 60) if faulted else rng.uniform(0, 0.1):.3f}"
+        values['U0'] = f"{rng.uniform(10, 50) if faulted else rng.uniform(0, 1):.3f}"
+        return values
+
+    records = []
+    for i in range(count):
+        gt = rng.choice(FAULT_TYPES)
+        records.append({
+            'line_name': f"line_num_{i}",
+            'station_name': str(i),
+            'time': '2024-02-12 00:00:00',
+            'reclosure': True,
+            'error_wave_one_cycle_ago': wave(),
+            'error_wave_one_cycle_after': wave(gt.split('_')[0]),
+            'error_again_wave_one_cycle_after': wave(),
+            'protect_recover': [],
+            'gt': gt,
+        })
+    return records
+
+def start_server(app, name: str):
+    """Serve a WSGI app on a free local port from a background thread"""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def bench_analyze(app_url: str, records: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Latency and throughput of concurrent /analyze requests"""
+    def analyze(record):
+        data = {'mode': 'prompt', 'file_content': str(record), 'model_id': args.model_datagen, 'use_cache': False}
+        start = time.time()
+        response = requests.post(f"{app_url}/analyze", json=data, timeout=120)
+        ok = response.status_code == 200 and bool(response.json().get('ai_response'))
+        return time.time() - start, ok
+
+    sample = [records[i % len(records)] for i in range(args.analyze_requests)]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.analyze_concurrency) as executor:
+        results = list(executor.map(analyze, sample))
+    elapsed = time.time() - start
+    latencies = [latency for latency, _ in results]
+    return {
+        'requests': len(results),
+        'failed': sum(1 for _, ok in results if not ok),
+        'wall_time': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed > 0 else 0,
+        'latency_p50': round(percentile(latencies, 0.5), 3),
+        'latency_p95': round(percentile(latencies, 0.95), 3),
+    }
+
+def bench_pipeline(app_url: str, data_path: str, output_dir: str, run: int, args,
+                   backend: str = 'http') -> Dict[str, Any]:
+    """Wall time of one power_instruct run, with the step times from its metrics report"""
+    run_dir = os.path.join(output_dir, f"{backend}_run_{run}")
+    command = [
+        sys.executable, os.path.join(ROOT_DIR, 'client', 'powerInstruct.py'),
+        '--api_url', f"{app_url}/analyze",
+        '--clean_url', f"{app_url}/clean",
+        '--backend', backend,
+        '--total_data_dir', data_path,
+        '--output_dir', run_dir,
+        '--model_datagen', args.model_datagen,
+        '--model_codegen', args.model_codegen,
+        '--max_iterations', str(args.max_iterations),
+        '--num_candidates', str(args.num_candidates),
+        '--beam_width', str(args.beam_width),
+        '--early_stop_confidence', str(args.early_stop_confidence),
+        '--early_stop_min_records', str(args.early_stop_min_records),
+        '--no_llm_cache',
+    ]
+    start = time.time()
+    completed = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True)
+    elapsed = time.time() - start
+    result = {'run': run, 'backend': backend, 'wall_time': round(elapsed, 3), 'returncode': completed.returncode}
+    metrics_file = os.path.join(run_dir, 'metrics.json')
+    if completed.returncode == 0 and os.path.exists(metrics_file):
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        result['step_times'] = report['execution_metrics']['step_times']
+        result['iterations'] = report['iteration_metrics']['total_iterations']
+        result['final_accuracy'] = report['iteration_metrics']['final_accuracy']
+        result['backend_metrics'] = report.get('backend_metrics', {})
+    else:
+        result['error'] = completed.stderr[-2000:]
+    return result
+
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Wall time statistics of the successful runs of one backend"""
+    ok = [r for r in runs if r['returncode'] == 0]
+    wall_times = [r['wall_time'] for r in ok]
+    transport = [r.get('backend_metrics', {}).get('transport_time', 0.0) for r in ok]
+    return {
+        'runs': runs,
+        'wall_time_mean': round(sum(wall_times) / len(wall_times), 3) if wall_times else None,
+        'wall_time_min': min(wall_times, default=None),
+        'wall_time_max': max(wall_times, default=None),
+        'transport_time_mean': round(sum(transport) / len(transport), 3) if transport else None,
+    }
+
+def benchmark():
+    args = parse_args()
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix='powerinstruct_bench_')
+    os.makedirs(output_dir, exist_ok=True)
+    mock_config = MockConfig(**{k: getattr(args, k) for k in asdict(MockConfig())})
+
+    mock_server, mock_url = start_server(create_mock_app(mock_config), 'mock-llm')
+    # Send every provider to the mock server and measure real requests only. Set before the app
+    # is imported, the pipeline subprocess inherits them.
+    for provider in ('DASHSCOPE', 'OPENAI'):
+        os.environ[f"{provider}_API_KEY"] = 'mock'
+        os.environ[f"{provider}_BASE_URL"] = f"{mock_url}/v1"
+    os.environ['LLM_CACHE_ENABLED'] = '0'
+
+    from app import create_app
+    app_server, app_url = start_server(create_app(), 'powerinstruct-app')
+
+    records = make_records(args.records)
+    data_path = os.path.join(output_dir, 'bench_data.json')
+    with open(data_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+    if args.data_format == 'jsonl':
+        data_path = convert_json_to_jsonl(data_path)
+
+    try:
+        print(f"Mock LLM: {mock_url}, app: {app_url}, output: {output_dir}")
+        analyze = bench_analyze(app_url, records, args)
+        print(f"/analyze: {analyze}")
+
+        pipeline = {}
+        for backend in [b.strip() for b in args.backends.split(',') if b.strip()]:
+            runs = []
+            for run in range(args.repeat):
+                result = bench_pipeline(app_url, data_path, output_dir, run, args, backend)
+                print(f"Pipeline run {run} ({backend}): {result['wall_time']:.2f}s"
+                      + (f", error: {result['error']}" if 'error' in result else ''))
+                runs.append(result)
+            pipeline[backend] = summarize_runs(runs)
+
+        report = {
+            'mock_config': asdict(mock_config),
+            'records': args.records,
+            'analyze': analyze,
+            'pipeline': pipeline,
+            'mock_stats': requests.get(f"{mock_url}/stats", timeout=10).json()['stats'],
+        }
+        if pipeline.get('http', {}).get('wall_time_mean') and pipeline.get('local', {}).get('wall_time_mean'):
+            report['local_time_saved'] = round(pipeline['http']['wall_time_mean']
+                                               - pipeline['local']['wall_time_mean'], 3)
+    finally:
+        app_server.shutdown()
+        mock_server.shutdown()
+
+    report_file = os.path.join(output_dir, 'benchmark.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for backend, summary in pipeline.items():
+        print(f"Pipeline wall time ({backend}): mean {summary['wall_time_mean']}s, "
+              f"min {summary['wall_time_min']}s, max {summary['wall_time_max']}s, "
+              f"transport {summary['transport_time_mean']}s")
+    if 'local_time_saved' in report:
+        print(f"Time saved by the local backend: {report['local_time_saved']}s per run")
+    print(f"Benchmark report saved to: {report_file}")
+
+
+if __name__ == '__main__':
+    benchmark()
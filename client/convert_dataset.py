@@ -0,0 +1,32 @@
+import sys
+import os
+import argparse
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.jsonl_dataset import convert_json_to_jsonl, load_index
+
+# Convert JSON array datasets to indexed JSONL, or (re)build the index of a JSONL dataset.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert JSON array datasets to indexed JSONL')
+    parser.add_argument('sources', nargs='+', help='JSON array files, or JSONL files to index')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Target JSONL file, only with a single source. Defaults to <source>.jsonl')
+    args = parser.parse_args()
+    if args.output and len(args.sources) > 1:
+        parser.error('--output needs a single source')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for source in args.sources:
+        if source.lower().endswith(('.jsonl', '.ndjson')):
+            offsets = load_index(source)
+            print(f"{source}: {len(offsets) - 1} records indexed")
+        else:
+            target = convert_json_to_jsonl(source, args.output)
+            print(f"{source} -> {target}")
@@ -0,0 +1,269 @@
+import sys
+import os
+import json
+import math
+import time
+import uuid
+import random
+import threading
+import argparse
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Optional
+from flask import Flask, Response, jsonify, request
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger import logger
+
+# Local stand-in for the chat completions API used by qwen_request and openai_request.
+# Point DASHSCOPE_BASE_URL / OPENAI_BASE_URL at http://<host>:<port>/v1 to use it.
+
+DATAGEN_RESPONSE = '''\
+{{
+"input": "Line name: {line_name}; One cycle simulation value before the fault: {before}; One cycle simulation value after the fault: {after}; Please give the reclosing summary, analysis conclusion and fault classification in json format. ",
+"output": "{{'Reclosing summary': 'The protection reclosing switches acted and the fault disappeared after reclosing, the reclosing was successful. ', 'Analysis conclusion': 'When the fault occurs, the voltage of the faulted phase is less than 55V and its current change is far greater than that of the other phases. ', 'Fault classification': 'C_fault'}}"
+}}'''
+
+# The first version only reports the first faulted phase, so two phase faults are misclassified
+# until the code has been improved once. This gives the optimization loop a second iteration.
+CODEGEN_RESPONSE = '''\
+```python
+def generate_instruction(input_data: dict) -> dict:
+    required = ['line_name', 'error_wave_one_cycle_ago', 'error_wave_one_cycle_after']
+    for key in required:
+        if key not in input_data:
+            raise ValueError(f"Missing required field: {{key}}")
+
+    before = input_data['error_wave_one_cycle_ago']
+    after = input_data['error_wave_one_cycle_after']
+    phases = [p for p in 'ABC' if float(after.get('U' + p.lower(), 0)) < 55]
+    phases = {phases}
+    fault = (''.join(phases) or 'Unknown') + '_fault'
+
+    output = {{
+        'Reclosing summary': 'The protection reclosing switches acted and the reclosing was successful. ',
+        'Analysis conclusion': f"The voltage of phase {{''.join(phases)}} is less than 55V when the fault occurs. ",
+        'Fault classification': fault,
+        '故障分类': fault,
+    }}
+    output_data = {{
+        'input': f"Line name: {{input_data['line_name']}}; One cycle simulation value before the fault: {{before}}; "
+                 f"One cycle simulation value after the fault: {{after}}; "
+                 "Please give the reclosing summary, analysis conclusion and fault classification in json format. ",
+        'output': str(output),
+    }}
+    return output_data
+```'''
+
+FEEDBACK_RESPONSE = '''\
+1. Error pattern analysis: the failed cases are two phase faults, the code only keeps the first phase whose voltage drops below 55V.
+2. Improvement suggestions: keep every phase below the threshold and join them, e.g. 'AB_fault'.
+3. Robustness enhancement: validate that the wave values are numeric before comparing them.'''
+
+
+@dataclass
+class MockConfig:
+    latency_mean: float = 0.5           # Seconds before the first token
+    latency_std: float = 0.2            # Spread of the (log-normal) first token latency
+    token_latency: float = 0.0          # Extra seconds per completion token
+    chars_per_token: float = 4.0        # Used to estimate the token counts from the text
+    token_jitter: float = 0.1           # Relative spread of the reported token counts
+    error_rate: float = 0.0             # Share of requests answered with HTTP 500
+    rate_limit_rate: float = 0.0        # Share of requests answered with HTTP 429
+    retry_after: float = 1.0            # Retry-After header sent with the 429 responses
+    timeout_rate: float = 0.0           # Share of requests that hang for `hang_seconds`
+    hang_seconds: float = 30.0
+    empty_rate: float = 0.0             # Share of requests answered with empty content
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    by_kind: Dict[str, int] = field(default_factory=dict)
+    injected: Dict[str, int] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def classify_prompt(prompt: str) -> str:
+    """Which pipeline step sent the prompt: 'feedback', 'improve', 'codegen' or 'datagen'"""
+    if 'Please start analyzing the reasons for failure' in prompt:
+        return 'feedback'
+    if 'professional Python code optimization expert' in prompt:
+        return 'improve'
+    if 'generate_instruction' in prompt:
+        return 'codegen'
+    return 'datagen'
+
+def scripted_response(kind: str) -> str:
+    """Response of the mock model for a pipeline step"""
+    if kind == 'feedback':
+        return FEEDBACK_RESPONSE
+    if kind == 'codegen':
+        return CODEGEN_RESPONSE.format(phases='phases[:1]')
+    if kind == 'improve':
+        return CODEGEN_RESPONSE.format(phases='sorted(phases)')
+    return DATAGEN_RESPONSE.format(
+        line_name='220kV A line',
+        before="{'Ua': '60.578', 'Ub': '61.345', 'Uc': '60.237'}",
+        after="{'Ua': '58.934', 'Ub': '60.032', 'Uc': '25.629'}",
+    )
+
+
+def create_mock_app(config: MockConfig = None) -> Flask:
+    """
+    Build the mock LLM server
+
+    Args:
+        config: latency, token and failure injection settings
+
+    Returns:
+        Flask app serving /v1/chat/completions, /v1/models and /stats
+    """
+    config = config or MockConfig()
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+    stats = MockStats()
+    stats_lock = threading.Lock()
+    app = Flask(__name__)
+
+    def count_tokens(text: str) -> int:
+        tokens = len(text) / config.chars_per_token
+        with rng_lock:
+            tokens *= max(0.0, rng.gauss(1.0, config.token_jitter))
+        return max(1, int(tokens))
+
+    def first_token_latency() -> float:
+        if config.latency_mean <= 0:
+            return 0.0
+        # Log-normal with the configured mean and standard deviation
+        sigma2 = math.log(1 + (config.latency_std / config.latency_mean) ** 2)
+        mu = math.log(config.latency_mean) - sigma2 / 2
+        with rng_lock:
+            return rng.lognormvariate(mu, math.sqrt(sigma2))
+
+    def injected_failure() -> Optional[str]:
+        with rng_lock:
+            draw = rng.random()
+        for name, rate in (('error', config.error_rate), ('rate_limit', config.rate_limit_rate),
+                           ('timeout', config.timeout_rate), ('empty', config.empty_rate)):
+            if draw < rate:
+                return name
+            draw -= rate
+        return None
+
+    def record(kind, failure=None, prompt_tokens=0, completion_tokens=0):
+        with stats_lock:
+            stats.requests += 1
+            stats.by_kind[kind] = stats.by_kind.get(kind, 0) + 1
+            if failure:
+                stats.injected[failure] = stats.injected.get(failure, 0) + 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    @app.route('/chat/completions', methods=['POST'])
+    def chat_completions():
+        data = request.get_json(silent=True) or {}
+        messages = data.get('messages') or []
+        prompt = '\n'.join(str(m.get('content', '')) for m in messages if m.get('role') == 'user')
+        kind = classify_prompt(prompt)
+
+        failure = injected_failure()
+        if failure == 'error':
+            record(kind, failure)
+            return jsonify({'error': {'message': 'Injected server error', 'type': 'server_error'}}), 500
+        if failure == 'rate_limit':
+            record(kind, failure)
+            response = jsonify({'error': {'message': 'Injected rate limit', 'type': 'rate_limit_error'}})
+            response.headers['Retry-After'] = str(config.retry_after)
+            return response, 429
+        if failure == 'timeout':
+            time.sleep(config.hang_seconds)
+
+        content = '' if failure == 'empty' else scripted_response(kind)
+        prompt_tokens = count_tokens(''.join(str(m.get('content', '')) for m in messages))
+        completion_tokens = count_tokens(content) if content else 0
+        record(kind, failure, prompt_tokens, completion_tokens)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = data.get('model', 'mock')
+
+        if data.get('stream'):
+            include_usage = (data.get('stream_options') or {}).get('include_usage', False)
+            return Response(stream_completion(completion_id, model, content, usage, include_usage),
+                            mimetype='text/event-stream')
+
+        time.sleep(first_token_latency() + completion_tokens * config.token_latency)
+        return jsonify({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+    def stream_completion(completion_id, model, content, usage, include_usage):
+        """Chat completion chunks as server-sent events, paced by the configured latencies"""
+        def chunk(delta, finish_reason=None, chunk_usage=None):
+            body = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [] if chunk_usage else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+                'usage': chunk_usage,
+            }
+            return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+        time.sleep(first_token_latency())
+        yield chunk({'role': 'assistant', 'content': ''})
+        # Send about one token per chunk
+        step = max(1, int(config.chars_per_token))
+        for start in range(0, len(content), step):
+            time.sleep(config.token_latency)
+            yield chunk({'content': content[start:start + step]})
+        yield chunk({}, finish_reason='stop')
+        if include_usage:
+            yield chunk(None, chunk_usage=usage)
+        yield "data: [DONE]\n\n"
+
+    @app.route('/v1/models', methods=['GET'])
+    @app.route('/models', methods=['GET'])
+    def list_models():
+        return jsonify({'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        with stats_lock:
+            return jsonify({'config': asdict(config), 'stats': asdict(stats)})
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Local OpenAI compatible mock LLM server')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    defaults = MockConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f'--{name}', type=type(value) if value is not None else int, default=value)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    config = MockConfig(**{k: getattr(args, k) for k in asdict(MockConfig())})
+    logger.info(f"Mock LLM server listening on http://{args.host}:{args.port}/v1")
+    create_mock_app(config).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,184 @@
+import sys
+import os
+import json
+import time
+import threading
+from functools import partial
+from typing import Dict, List, Any
+import requests
+from requests.adapters import HTTPAdapter
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_cleaner import CleaningRules, clean_ndjson
+from utils.api_utils import get_provider, run_many
+from config.settings import LLM_CONCURRENCY
+
+# How power_instruct reaches the /analyze and /clean service layer: over HTTP for a remote
+# server, or in-process without the HTTP hop.
+
+
+class PipelineBackend:
+    """Common call accounting, subclasses implement `_analyze` and `_clean`"""
+    name = ''
+
+    def __init__(self):
+        self.calls = 0
+        self.call_time = 0.0
+        self.transport_time = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, elapsed: float, transport: float = 0.0):
+        # Candidates are generated from several threads
+        with self._lock:
+            self.calls += 1
+            self.call_time += elapsed
+            self.transport_time += transport
+
+    def analyze(self, data: Dict[str, Any], timeout: float = 120) -> Dict[str, Any]:
+        """Run an /analyze request, returns its JSON body"""
+        return self._analyze(data, timeout)
+
+    def analyze_many(self, requests_data: List[Dict[str, Any]], timeout: float = 120) -> List[Dict[str, Any]]:
+        """
+        Run several /analyze requests concurrently, bounded by the concurrency limit of each model's provider
+
+        Returns:
+            One dict per request, in input order, with the JSON body in `result`, or `error` and
+            `error_type` if the request failed
+        """
+        calls = []
+        for data in requests_data:
+            model_id = data.get('model_id', '')
+            try:
+                provider = get_provider(model_id)
+            except ValueError:
+                # The service reports the unknown model, its requests share a limit of their own
+                provider = model_id
+            calls.append((provider, partial(self.analyze, data, timeout)))
+        return run_many(calls)
+
+    def clean(self, data: Dict[str, Any], timeout: float = 30) -> Dict[str, Any]:
+        """Run a /clean request, returns its JSON body"""
+        return self._clean(data, timeout)
+
+    def clean_file(self, source: str, target: str, rules: Dict[str, Any] = None, timeout: float = 600) -> int:
+        """Clean a JSONL dataset into another JSONL file, returns the number of records written"""
+        return self._clean_file(source, target, rules, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'calls': self.calls,
+                'call_time': round(self.call_time, 3),
+                'transport_time': round(self.transport_time, 3),
+            }
+
+
+class HttpBackend(PipelineBackend):
+    """
+    Talks to a running PowerInstruct server
+
+    The server reports its own processing time in the X-Process-Time header, the rest of
+    each round trip is counted as transport time.
+    """
+    name = 'http'
+
+    def __init__(self, api_url: str, clean_url: str):
+        super().__init__()
+        self.api_url = api_url
+        self.clean_url = clean_url
+        # Keep-alive connections shared by every call, enough for all the concurrent requests of analyze_many
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=sum(LLM_CONCURRENCY.values()))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _post(self, url: str, data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        start = time.perf_counter()
+        response = self.session.post(url, json=data, timeout=timeout)
+        body = response.json()
+        self._record_response(response, time.perf_counter() - start)
+        return body
+
+    def _record_response(self, response, elapsed: float):
+        try:
+            server_time = float(response.headers.get('X-Process-Time', 0))
+        except ValueError:
+            server_time = 0.0
+        self._record(elapsed, max(0.0, elapsed - server_time) if server_time else 0.0)
+
+    def _analyze(self, data, timeout):
+        return self._post(self.api_url, data, timeout)
+
+    def _post_ndjson(self, body, rules, timeout):
+        # Records are uploaded and read back as NDJSON, so the server cleans them chunk by chunk
+        response = self.session.post(self.clean_url, data=body, params=rules, timeout=timeout,
+                                     headers={'Content-Type': 'application/x-ndjson'}, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise ValueError(f"Data cleaning failed: {response.json().get('message', response.status_code)}")
+        return response
+
+    def _clean(self, data, timeout):
+        body = (json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+                for record in data.get('raw_data', []))
+        start = time.perf_counter()
+        with self._post_ndjson(body, data.get('rules'), timeout) as response:
+            cleaned_data = [json.loads(line) for line in response.iter_lines() if line]
+        self._record_response(response, time.perf_counter() - start)
+        return {'cleaned_data': cleaned_data, 'message': 'Successfully cleaned data'}
+
+    def _clean_file(self, source, target, rules, timeout):
+        start = time.perf_counter()
+        with open(source, 'rb') as body, self._post_ndjson(body, rules, timeout) as response, \
+                open(target, 'wb') as f:
+            for block in response.iter_content(64 * 1024):
+                f.write(block)
+        self._record_response(response, time.perf_counter() - start)
+        return int(response.headers.get('X-Record-Count', 0))
+
+
+class LocalBackend(PipelineBackend):
+    """Calls the service layer of the app in this process, timeouts do not apply"""
+    name = 'local'
+
+    def __init__(self):
+        super().__init__()
+        from app.services.analysis_service import AnalysisService
+        self.service = AnalysisService()
+
+    def _analyze(self, data, timeout):
+        start = time.perf_counter()
+        try:
+            return self.service.run_analysis(data)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def _clean(self, data, timeout):
+        start = time.perf_counter()
+        try:
+            raw_data = data.get('raw_data', [])
+            if not isinstance(raw_data, list):
+                raise ValueError('Invalid input format: raw_data should be a list')
+            cleaned_data = self.service.clean_records(raw_data, CleaningRules.from_dict(data.get('rules')))
+            return {'cleaned_data': cleaned_data, 'message': 'Successfully cleaned data'}
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def _clean_file(self, source, target, rules, timeout):
+        start = time.perf_counter()
+        try:
+            with open(source, 'rb') as lines, open(target, 'wb') as f:
+                return clean_ndjson(lines, f, CleaningRules.from_dict(rules))
+        finally:
+            self._record(time.perf_counter() - start)
+
+
+def create_backend(args) -> PipelineBackend:
+    """Backend selected by `--backend`"""
+    if args.backend == 'local':
+        return LocalBackend()
+    return HttpBackend(args.api_url, args.clean_url)
@@ -9,6 +9,7 @@ from typing import Dict, List, Any
 import requests
 from requests.exceptions import RequestException
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the project root directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,8 +19,13 @@ from utils.prompt_template.directgen_prompt import *
 from utils.run_python_utils import *
 from utils.file_utils import *
 from utils.logger import logger
-from utils.api_utils import api_request
-from utils.metrics import MetricsCollector
+from utils.api_utils import api_request_many
+from utils.rate_limiter import backoff_delay
+from utils.executor import CodeExecutor, BatchExecutor, batch_statistics
+from utils.metrics import MetricsCollector, wilson_interval
+from utils.jsonl_dataset import JsonlDataset, load_dataset
+from utils import json_serializer
+from client.pipeline_backend import create_backend
 
 
 import datetime
@@ -47,6 +53,7 @@ SUPPORT_MODEL_REF = [
 # TOTAL_DATA_DIR = "/Users/czy/projects/baohuchu_demo/data/test_data/102个测试样本-1015_20250307_173953_318ee91831f5aaac.json"
 OUTPUT_FILE = "batch_results.json"
 metrics = MetricsCollector()
+backend = None
 
 
 def parse_args():
@@ -54,12 +61,14 @@ def parse_args():
     parser.add_argument('--output_dir', type=str, default=CURRENT_OUTPUT_DIR, help='Base directory for output files')
     parser.add_argument('--total_data_dir', type=str, 
                         default="/Users/czy/projects/baohuchu_demo/data/test_data/1049个训练样本-1016_20250324_180309_ce79e70008f87ff1.json",
-                        help='Path to total data file')
+                        help='Path to total data file, a JSON array or a JSONL dataset')
     # API related parameters
     parser.add_argument('--api_url', type=str, default="http://localhost:5000/analyze",
                         help='API URL for analysis')
     parser.add_argument('--clean_url', type=str, default='http://localhost:5000/clean',
                         help='API URL for data cleaning')
+    parser.add_argument('--backend', type=str, default='http', choices=['http', 'local'],
+                        help='Reach the service over HTTP (api_url/clean_url) or run it in this process')
 
     # Model selection parameters
     parser.add_argument('--model_datagen', type=str, default="gpt-4o-0806",
@@ -78,6 +87,18 @@ def parse_args():
                         help='Number of test samples')
     parser.add_argument('--max_failures', type=int, default=2,
                         help='Maximum number of failure cases to collect')
+    parser.add_argument('--num_candidates', type=int, default=1,
+                        help='Candidate programs generated in parallel from each beam entry per iteration')
+    parser.add_argument('--beam_width', type=int, default=1,
+                        help='Best programs kept across iterations')
+    parser.add_argument('--early_stop_confidence', type=float, default=0.0,
+                        help='Stop evaluating a program once its accuracy is settled at this confidence, 0 disables')
+    parser.add_argument('--early_stop_min_records', type=int, default=20,
+                        help='Records evaluated before early stopping may happen')
+    parser.add_argument('--no_llm_cache', action='store_true',
+                        help='Always query the LLM instead of reusing cached responses')
+    parser.add_argument('--no_eval_cache', action='store_true',
+                        help='Always run the generated code instead of reusing cached results')
 
     args = parser.parse_args()
     return args
@@ -114,24 +135,52 @@ def select_random_data(data) -> Dict[str, Any]:
         raise ValueError(f"Error reading data: {str(e)}")
     
 
-def save_results(args, results: Dict[str, Any], filename: str = "batch_results.json") -> None:
-    """Save the final result"""
-    try:
-        # Make sure the output directory exists
-        os.makedirs(args.output_dir, exist_ok=True)
-        
-        # Using timestamp directories
-        output_file = os.path.join(args.output_dir, filename)
-        
-        with open(output_file, "w", encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+def _analyze_with_retries(requests_data: List[Dict[str, Any]], timeout: float, parse=None,
+                          max_retries: int = 3, retry_delay: int = 5) -> List[Any]:
+    """
+    Send /analyze requests concurrently, retrying the ones that fail or come back empty
 
-        accuracy = convert_result_to_chat(args, source_file=output_file)
-        logger.info(f"Results saved to: {filename}")
+    Args:
+        requests_data: /analyze request bodies
+        timeout: timeout of each request (seconds)
+        parse: turns an AI response into the result, a response it cannot parse is retried
+        max_retries: Maximum number of retries
+        retry_delay: Base delay of the exponential backoff between retries (seconds)
 
-    except Exception as e:
-        logger.error(f"Failed to save result: {str(e)}")
-        raise
+    Returns:
+        The (parsed) AI response of each request, in order, None for the requests that still failed
+    """
+    results = [None] * len(requests_data)
+    pending = list(range(len(requests_data)))
+    for attempt in range(max_retries + 1):
+        outcomes = backend.analyze_many([requests_data[i] for i in pending], timeout=timeout)
+        failed = []
+        for i, outcome in zip(pending, outcomes):
+            if outcome['error'] is not None:
+                logger.error(f"API request failed on attempt {attempt + 1}: {outcome['error']}")
+                failed.append(i)
+                continue
+            response = outcome['result']
+            metrics.add_tokens(response.get("token_prompt", 0), response.get("token_compli", 0),
+                               cached=response.get("cached", False))
+            ai_response = response.get("ai_response")
+            if not ai_response:
+                logger.warning(f"AI response is empty, attempt {attempt + 1} of {max_retries + 1}")
+                failed.append(i)
+                continue
+            try:
+                results[i] = parse(ai_response) if parse else ai_response
+            except Exception as e:
+                logger.error(f"Parsing the AI response failed on attempt {attempt + 1}: {str(e)}")
+                failed.append(i)
+        pending = failed
+        if not pending or attempt == max_retries:
+            break
+        # A retry must not get the same cached answer back
+        for i in pending:
+            requests_data[i] = {**requests_data[i], "use_cache": False}
+        time.sleep(backoff_delay(attempt, retry_delay))
+    return results
 
 
 def get_standard_data(args, single_data: Dict[str, Any], max_retries: int = 3, retry_delay: int = 5) -> str:
@@ -141,7 +190,7 @@ def get_standard_data(args, single_data: Dict[str, Any], max_retries: int = 3, r
     Args:
         single_data: input single data
         max_retries: Maximum number of retries
-        retry_delay: Delay between each retry (seconds)
+        retry_delay: Base delay of the exponential backoff between retries (seconds)
         
     Returns:
         Standard format data string
@@ -149,100 +198,75 @@ def get_standard_data(args, single_data: Dict[str, Any], max_retries: int = 3, r
     if not single_data:
         raise ValueError("Input data is empty.")
     
-    for attempt in range(max_retries + 1):
-        try:
-            data = {
-                "filepath": args.total_data_dir,
-                "mode": "prompt",
-                "file_content": str(single_data),
-                "template": datagen_1shot_system_prompt(),
-                "model_id": args.model_datagen,
-            }
-
-            response = requests.post(args.api_url, json=data, timeout=120).json()
-            ai_response = response.get("ai_response")
-            token_prompt, token_cli = response.get("token_prompt", 0), response.get("token_compli", 0)
-            metrics.add_tokens(token_prompt, token_cli)
-            
-            if ai_response:
-                logger.info("Successfully obtained standard data format")
-                return ai_response
-            
-            logger.warning(f"AI response is empty, try the {attempt + 1} times")
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-            else:
-                raise ValueError("AI response remains empty after multiple attempts")
-                
-        except RequestException as e:
-            logger.error(f"API request failed: {str(e)}")
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-            else:
-                raise
-
-
-def generate_code(args, prompt: str, max_retries: int = 3, retry_delay: int = 5) -> str:
+    data = {
+        "filepath": args.total_data_dir,
+        "mode": "prompt",
+        "file_content": str(single_data),
+        "template": datagen_1shot_system_prompt(),
+        "model_id": args.model_datagen,
+        "use_cache": not args.no_llm_cache,
+    }
+    ai_response = _analyze_with_retries([data], timeout=120, max_retries=max_retries, retry_delay=retry_delay)[0]
+    if not ai_response:
+        raise ValueError("AI response remains empty after multiple attempts")
+    logger.info("Successfully obtained standard data format")
+    return ai_response
+
+
+def _codegen_request(args, prompt: str, use_cache: bool) -> Dict[str, Any]:
+    return {
+        "filepath": args.total_data_dir,
+        "mode": "codegen",
+        "file_content": str(prompt),            # prompt is here
+        "template": codegen_1shot_system_prompt(), # not used
+        "model_id": args.model_codegen,
+        "use_cache": use_cache and not args.no_llm_cache,
+    }
+
+
+def generate_code(args, prompt: str, max_retries: int = 3, retry_delay: int = 5, use_cache: bool = True) -> str:
     """
     Generate executable Python code
     
     Args:
         prompt: Input prompt for code generation
         max_retries: Maximum number of retries
-        retry_delay: Delay between each retry (seconds)
+        retry_delay: Base delay of the exponential backoff between retries (seconds)
+        use_cache: Whether the first attempt may reuse a cached answer
         
     Returns:
         Executable Python code
     """
-    for attempt in range(max_retries + 1):
-        try:
-            data = {
-                "filepath": args.total_data_dir,
-                "mode": "codegen",
-                "file_content": str(prompt),            # prompt is here
-                "template": codegen_1shot_system_prompt(), # not used
-                "model_id": args.model_codegen,
-            }
-            
-            response = requests.post(args.api_url, json=data, timeout=180).json()
+    executed_code = _analyze_with_retries([_codegen_request(args, prompt, use_cache)], timeout=180,
+                                          parse=get_executed_python_code,
+                                          max_retries=max_retries, retry_delay=retry_delay)[0]
+    if not executed_code:
+        raise ValueError("AI response remains empty after multiple attempts")
+    logger.debug(f"Generated code: {executed_code}")
+    logger.info("Successfully generated code")
+    return executed_code
+
+def generate_candidates(args, prompts: List[str], num_candidates: int) -> List[List[str]]:
+    """
+    Generate several candidate programs for each prompt, all requests are sent concurrently
+
+    Only the first candidate of a prompt may come from the LLM cache, the others are fresh samples.
+    Candidates that fail to generate are dropped, duplicates are removed.
+
+    Returns:
+        The distinct candidate programs of each prompt, in order, at least one overall
+    """
+    num_candidates = max(1, num_candidates)
+    requests_data = [_codegen_request(args, prompt, use_cache=(i == 0))
+                     for prompt in prompts for i in range(num_candidates)]
+    codes = _analyze_with_retries(requests_data, timeout=180, parse=get_executed_python_code)
+    candidates = []
+    for start in range(0, len(codes), num_candidates):
+        candidates.append(list(dict.fromkeys(code for code in codes[start:start + num_candidates] if code)))
+    if not any(candidates):
+        raise ValueError("All candidate code generations failed")
+    return candidates
 
-            ai_response = response.get("ai_response")
-            token_prompt, token_cli = response.get("token_prompt"), response.get("token_compli")
-            metrics.add_tokens(token_prompt, token_cli)
-            
-            if ai_response:
-                executed_code = get_executed_python_code(ai_response)
-                logger.debug(f"Generated code: {executed_code}")
-                logger.info(f"Successfully generated code on attempt {attempt + 1}")
-                return executed_code
-            
-            logger.warning(f"AI response is empty, attempt {attempt + 1} of {max_retries + 1}")
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-            else:
-                raise ValueError("AI response remains empty after multiple attempts")
-                
-        except RequestException as e:
-            logger.error(f"API request failed on attempt {attempt + 1}: {str(e)}")
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-                continue
-            raise
-        except Exception as e:
-            logger.error(f"Code generation failed on attempt {attempt + 1}: {str(e)}")
-            if attempt < max_retries:
-                time.sleep(retry_delay)
-                continue
-            raise
-
-def concat_input(executed_code: str, input_data: Dict[str, Any]) -> str:
-    """concat code and input data"""
-    main_code = f"""\n\n
-if __name__ == '__main__':
-    # test data
-    input_data = {input_data}
-"""
-    return executed_code + main_code
 
 def run_single_data(executed_code: str, input_data: Dict[str, Any]) -> Any:
     """
@@ -255,213 +279,163 @@ def run_single_data(executed_code: str, input_data: Dict[str, Any]) -> Any:
     Returns:
         Processing results
     """
-    output = StringIO()
-    try:
-        # 1. Data Validation
-        if not input_data or not isinstance(input_data, dict):
-            raise ValueError("Invalid input data")
-            
-        # 2. Get the actual data (because the previous select_random_data returned a dictionary with id)
-        actual_data = input_data.get('data') if 'data' in input_data else input_data
-        
-        # 3. Executing Code
-        final_code = concat_input(executed_code, actual_data)
-        
-        try:
-            result = run_code(code=final_code, output=output)
-            logger.debug(f"Code execution results: {result}")
-        except Exception as e:
-            logger.error(f"Code execution error: {str(e)}")
-            return {
-                'code': 500,
-                'success': False,
-                'error': str(e),
-                'input_data': actual_data
-            }
-        
-        # 4. Processing results
-        stdout_content = output.getvalue()
-        formatted_output = format_output(result)
-        
-        return {
-            'code': 200,
-            'success': True,
-            'result': str(formatted_output),
-            'stdout': stdout_content,
-            'executed_code': executed_code
-        }
-        
-    except Exception as e:
-        error_msg = f"Failed to process data: {str(e)}"
-        logger.error(error_msg)
-        return {
-            'code': 500,
-            'success': False,
-            'error': error_msg,
-            'input_data': input_data
-        }
+    return CodeExecutor(executed_code).run_single(input_data)
 
 def run_batch_data(args, total_data_dir: str, executed_code: str) -> Dict[str, Any]:
     """
     Batch data processing
 
+    Results are written as the executor returns them: successful entries to batch_results.json
+    and, converted, to chat_results.json and test_results.json. Only failures are kept in memory.
+
     Args:
         total_data_dir: data file path
         executed_code: code to be executed
 
     Returns:
         Dict containing:
-            - success_results: list of successful processing results
             - failed_results: failed data and error information
             - statistics: processing statistics
+            - accuracy: prediction accuracy of the successful results
     """
     try:
-        with open(total_data_dir, "r", encoding='utf-8') as f:
-            batch_data = json.load(f)
+        batch_data = load_dataset(total_data_dir)
             
         if not batch_data:
             raise ValueError("The data list is empty")
-            
-        success_results = []
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        output_file = os.path.join(args.output_dir, OUTPUT_FILE)
         failed_results = []
-        total = len(batch_data)
-        success_count = 0
-        failure_count = 0
-        
-        for i, data in enumerate(batch_data, 1):
-            # import ipdb; ipdb.set_trace()
-            try:
-                
-                # Data Validation
-                if not isinstance(data, dict):
-                    raise ValueError(f"Data format error: expected dict type, actual{type(data)}")
-                
-                # Execution Processing
-                result = run_single_data(executed_code=executed_code, input_data=data)
-                
-                success_results.append({
-                    "index": i-1,
-                    "input": data,
-                    "result": result
-                })
-                success_count += 1
-                
-            except Exception as e:
-                failure_count += 1
-                error_info = {
-                    "index": i-1,
-                    "input": data,
-                    "error": str(e),
-                    "error_type": type(e).__name__
-                }
-                failed_results.append(error_info)
-                logger.error(f"Failed to process the {i}th data: {str(e)}")
-                continue  
-       
-        statistics = {
-            "total": total,
-            "success": success_count,
-            "failure": failure_count,
-            "success_rate": f"{(success_count/total)*100:.2f}%"
-        }
+        entries = BatchExecutor(executed_code, use_cache=not args.no_eval_cache).iter_results(batch_data)
+        with json_serializer.JsonArrayWriter(output_file, key='success_results') as writer, \
+                ChatResultWriter(args) as chat_writer:
+            for entry in entries:
+                if 'error' in entry:
+                    failed_results.append(entry)
+                    continue
+                writer.write(entry)
+                chat_writer.add(entry)
+            statistics = batch_statistics(len(batch_data), writer.count, len(failed_results))
+            writer.trailer = {'failed_results': failed_results, 'statistics': statistics}
+        logger.info(f"Results saved to: {OUTPUT_FILE}")
         
-        final_results = {
-            "success_results": success_results,
-            "failed_results": failed_results,
-            "statistics": statistics
+        logger.info(f"Processing completed. Success: {statistics['success']}, Failure: {statistics['failure']}")
+        return {
+            'failed_results': failed_results,
+            'statistics': statistics,
+            'accuracy': chat_writer.accuracy
         }
         
-        save_results(args, final_results)
-        
-        logger.info(f"Processing completed. Success: {success_count}, Failure: {failure_count}")
-        return final_results
-        
     except Exception as e:
-        print(f"\nFailed to process the {i}th data: {str(e)}")
         logger.error(f"Batch processing failed: {str(e)}")
         raise
 
-def convert_result_to_chat(args, source_file: str, target_filename: str = 'chat_results.json'):
-    try:
-        with open(source_file, 'r', encoding='utf-8') as f:
-            source_data = json.load(f)
-        
-        chat_results = []
-        target_filedir = os.path.join(args.output_dir, target_filename)
-        test_result_dir = os.path.join(args.output_dir, 'test_results.json')
 
-        total_count = 0
-        correct_count = 0
-        
-        for item in source_data.get('success_results', []):
-            try:
-                result_str = item['result']['result']
-                result_dict = json.loads(result_str)
-                gt = item['input']['gt']
-                pred = ast.literal_eval(result_dict['output'])['故障分类']
-
-                chat_result = {
-                    "index": item['index'],
-                    "chat": [
-                        {
-                            "role": "Human",
-                            "content": result_dict['input'],
-                            "metadata": {
-                                "language": "cn",
-                                "task": "BaohuchuFenlei.Q"
-                            }
-                        },
-                        {
-                            "role": "Assistant",
-                            "content": result_dict['output'],
-                            "metadata": {
-                                "language": "cn",
-                                "task": "BaohuchuFenlei.A"
-                            }
+def _parse_result(result) -> Dict[str, Any]:
+    """Output of the generated code in a batch entry, result files written before it was structured hold a JSON string"""
+    return json.loads(result) if isinstance(result, str) else result
+
+def _parse_output(output) -> Dict[str, Any]:
+    """The `output` field of a result, usually the repr of a dict"""
+    return output if isinstance(output, dict) else ast.literal_eval(output)
+
+
+class ChatResultWriter:
+    """
+    Convert successful batch entries to chat samples as they arrive
+
+    Samples are appended to chat_results.json and to the `results` of test_results.json,
+    which gets its accuracy statistics once closed. Use as a context manager.
+    """
+    def __init__(self, args, target_filename: str = 'chat_results.json'):
+        self.total_count = 0
+        self.correct_count = 0
+        self._chat = json_serializer.JsonArrayWriter(os.path.join(args.output_dir, target_filename))
+        self._test = json_serializer.JsonArrayWriter(os.path.join(args.output_dir, 'test_results.json'), key='results')
+
+    def add(self, item: Dict[str, Any]):
+        try:
+            result_dict = _parse_result(item['result']['result'])
+            gt = item['input']['gt']
+            pred = _parse_output(result_dict['output'])['故障分类']
+
+            chat_result = {
+                "index": item['index'],
+                "chat": [
+                    {
+                        "role": "Human",
+                        "content": result_dict['input'],
+                        "metadata": {
+                            "language": "cn",
+                            "task": "BaohuchuFenlei.Q"
+                        }
+                    },
+                    {
+                        "role": "Assistant",
+                        "content": result_dict['output'],
+                        "metadata": {
+                            "language": "cn",
+                            "task": "BaohuchuFenlei.A"
                         }
-                    ],
-                    "metadata": {
-                        "language": "cn",
-                        "gt": gt,
-                        "pred": pred
                     }
+                ],
+                "metadata": {
+                    "language": "cn",
+                    "gt": gt,
+                    "pred": pred
                 }
-                
-                
-                total_count += 1
-                correct_count += label_adjustment(gt, pred)
-                # correct_count += (gt == pred)
-                
-                
-                chat_results.append(chat_result)
-                
-            except Exception as e:
-                print(f"Error processing index {item['index']}: {str(e)}")
-                # Calculate the accuracy
-        
-        accuracy = correct_count / total_count if total_count > 0 else 0
-        accuracy_percentage = f"{accuracy * 100:.2f}%"
-        
-        # Create results with statistics
-        final_results = {
+            }
+        except Exception as e:
+            print(f"Error processing index {item['index']}: {str(e)}")
+            return
+
+        self.total_count += 1
+        self.correct_count += label_adjustment(gt, pred)
+        # Both files hold the same sample, it is encoded once
+        encoded = self._chat.encode(chat_result)
+        self._chat.write_encoded(encoded)
+        self._test.write_encoded(encoded)
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct_count / self.total_count if self.total_count > 0 else 0
+
+    def close(self):
+        accuracy_percentage = f"{self.accuracy * 100:.2f}%"
+        self._test.trailer = {
             "statistics": {
-                "total_samples": total_count,
-                "correct_predictions": correct_count,
+                "total_samples": self.total_count,
+                "correct_predictions": self.correct_count,
                 "accuracy": accuracy_percentage
-            },
-            "results": chat_results
+            }
         }
-        with open(test_result_dir, 'w', encoding='utf-8') as f:
-            json.dump(final_results, f, ensure_ascii=False, indent=2)   
-        
-        # Save the converted results
-        with open(target_filedir, 'w', encoding='utf-8') as f:
-            json.dump(chat_results, f, ensure_ascii=False, indent=2)
-            
-        print(f"Conversion completed, total processing {len(chat_results)} samples")
-        print(f"Prediction accuracy: {accuracy_percentage} ({correct_count}/{total_count})")
-        return accuracy
-    
+        self._test.close()
+        self._chat.close()
+        print(f"Conversion completed, total processing {self.total_count} samples")
+        print(f"Prediction accuracy: {accuracy_percentage} ({self.correct_count}/{self.total_count})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._test.abort()
+            self._chat.abort()
+
+
+def convert_result_to_chat(args, source_file: str, target_filename: str = 'chat_results.json'):
+    """Convert a saved batch_results.json, run_batch_data converts its results as they are produced"""
+    try:
+        with open(source_file, 'rb') as f:
+            source_data = json_serializer.loads(f.read())
+
+        with ChatResultWriter(args, target_filename) as chat_writer:
+            for item in source_data.get('success_results', []):
+                chat_writer.add(item)
+        return chat_writer.accuracy
 
     except Exception as e:
         print(f"Error during conversion: {str(e)}")
@@ -469,7 +443,7 @@ def convert_result_to_chat(args, source_file: str, target_filename: str = 'chat_
 
 def data_cleaning(args, data):
     try:
-        response = requests.post(args.clean_url, json=data, timeout=30).json()
+        response = backend.clean(data, timeout=30)
         processed_data = response.get('cleaned_data', [])
         print(f"cleaned data: {len(processed_data)}")
         return processed_data
@@ -479,29 +453,76 @@ def data_cleaning(args, data):
         raise
 
 
-def _evaluate_code(executed_code, test_samples):
+def clean_dataset(args, dataset: JsonlDataset) -> JsonlDataset:
+    """Clean a JSONL dataset record by record into the output directory, nothing is held in memory"""
+    os.makedirs(args.output_dir, exist_ok=True)
+    target = os.path.join(args.output_dir, 'cleaned_data.jsonl')
+    try:
+        count = backend.clean_file(dataset.path, target)
+        print(f"cleaned data: {count}")
+        return JsonlDataset(target)
+    except:
+        logger.error("failed to clean data")
+        raise
+
+
+def _early_stop(correct_count, total_count, reject_below, accept_above, confidence, min_records):
+    """
+    Whether the accuracy of a program is settled before all samples were evaluated
+
+    Returns:
+        'rejected' when the upper confidence bound is below `reject_below`, 'confirmed' when the
+        lower bound is above `accept_above`, otherwise None
+    """
+    if not confidence or total_count < min_records:
+        return None
+    lower, upper = wilson_interval(correct_count, total_count, confidence)
+    if reject_below is not None and upper < reject_below:
+        return 'rejected'
+    if accept_above is not None and lower > accept_above:
+        return 'confirmed'
+    return None
+
+def _evaluate_code(executed_code, test_samples, reject_below=None, accept_above=None, confidence=0.0, min_records=20,
+                   use_cache=True):
+    """
+    Evaluate a program on test samples
+
+    With a `confidence`, evaluation stops as soon as the program is known, at that confidence,
+    to be below `reject_below` or above `accept_above`. The remaining records are not run.
+
+    Returns:
+        (accuracy, failure_cases, evaluated, stopped), `evaluated` is the number of records scored before
+        stopping, `stopped` is 'rejected', 'confirmed' or None when every record was scored
+    """
     total_count = 0
     correct_count = 0
 
     failure_cases = []
     max_failures = 3
-
-    for i, data in enumerate(test_samples):
+    stopped = None
+
+    results = BatchExecutor(executed_code, use_cache=use_cache).iter_results(test_samples)
+    for entry in results:
+        stopped = _early_stop(correct_count, total_count, reject_below, accept_above, confidence, min_records)
+        if stopped:
+            # Closing the generator cancels the shards that have not run yet
+            results.close()
+            break
+        i, data = entry['index'], entry['input']
         try:
-            if not isinstance(data, dict):
-                raise ValueError(f"Data format error: expected dict type, actual{type(data)}")
+            if 'error' in entry:
+                raise ValueError(entry['error'])
             
-            # Execute processing
-            result = run_single_data(executed_code=executed_code, input_data=data)
+            result = entry['result']
              
             # Parsing results
-            result_str = result['result']
-            result_dict = json.loads(result_str)
+            result_dict = _parse_result(result['result'])
             gt = data['gt']
             # import ipdb; ipdb.set_trace()
             # Check if the output format is correct
             try:
-                output_dict = ast.literal_eval(result_dict['output'])
+                output_dict = _parse_output(result_dict['output'])
                 if 'Fault classification' not in output_dict:
                     raise KeyError("The 'Fault Classification' field is missing in the output results")
                 pred = output_dict['Fault classification']
@@ -546,16 +567,34 @@ def _evaluate_code(executed_code, test_samples):
                 failure_cases.append({
                     'index': i,
                     'input': data,
-                    'ground_truth': data.get('gt', 'Unknown'),
+                    'ground_truth': data.get('gt', 'Unknown') if isinstance(data, dict) else 'Unknown',
                     'error_type': 'EXECUTION_ERROR',
                     'error_message': str(e),
-                    'error_class': e.__class__.__name__
+                    'error_class': entry.get('error_type', e.__class__.__name__)
                 })
             total_count += 1
             continue
-    print(f"total count: {total_count}, correct_count: {correct_count}")
+    print(f"total count: {total_count}/{len(test_samples)}, correct_count: {correct_count}"
+          + (f", stopped early: {stopped}" if stopped else ""))
     accuracy = correct_count / total_count if total_count > 0 else 0
-    return accuracy, failure_cases
+    return accuracy, failure_cases, total_count, stopped
+
+def _evaluate_candidates(codes, test_samples, **kwargs):
+    """
+    Evaluate candidate programs concurrently on the same samples, see _evaluate_code for `kwargs`
+
+    Returns:
+        (accuracy, code, failure_cases, evaluated, rejected) per program, best first. A program
+        rejected by early stopping has an accuracy measured on a few records only, it ranks below
+        every program that was not rejected.
+    """
+    with ThreadPoolExecutor(max_workers=len(codes)) as executor:
+        results = list(executor.map(lambda code: _evaluate_code(code, test_samples, **kwargs), codes))
+    ranked = [(accuracy, code, failure_cases, evaluated, stopped == 'rejected')
+              for code, (accuracy, failure_cases, evaluated, stopped) in zip(codes, results)]
+    # Stable sort, on equal accuracy the earlier (older) program ranks first
+    ranked.sort(key=lambda item: (not item[4], item[0]), reverse=True)
+    return ranked
 
 def format_failed_cases(failed_cases):
     """Format the failure cases into a more understandable form"""
@@ -584,7 +623,8 @@ def format_failed_cases(failed_cases):
     return "\n".join(formatted_cases)
 
 
-def _get_llm_feedback(args, current_code, failed_cases):
+def _feedback_prompt(current_code, failed_cases):
+    """Prompt asking for an analysis of the failures of a program"""
     error_stats = {}
     for case in failed_cases:
         error_type = case.get('error_type', 'Unknown')
@@ -594,7 +634,7 @@ def _get_llm_feedback(args, current_code, failed_cases):
 
     # import ipdb; ipdb.set_trace()
 
-    feedback_prompt = f"""As a Python programming and code optimization expert, please help analyze and improve the following Python code.
+    return f"""As a Python programming and code optimization expert, please help analyze and improve the following Python code.
 Current code:
 ```python
 {current_code}
@@ -608,10 +648,54 @@ Please provide analysis and suggestions in the following steps:
 3. Robustness enhancement: Suggest adding error handling mechanisms; provide improvement solutions for input validation and exception handling; please provide detailed code examples and explanations.
 Please start analyzing the reasons for failure below:
 """
-    feedback_from_llm, token_prompt, token_cli = api_request(feedback_prompt, model=args.model_codegen)
-    metrics.add_tokens(token_prompt, token_cli)
 
-    return feedback_from_llm
+
+def _improvement_prompt(current_code, feedback, failed_cases):
+    """Prompt asking for an improved program, based on the feedback on its failures"""
+    return f"""You are a professional Python code optimization expert. Please generate improved code based on the following information:
+1. Current code:
+```python
+{current_code}
+2. Analyze feedback:
+Improved code based on feedback from:
+{feedback}
+3. Summary of failure cases:
+{json.dumps([{'error_type': case.get('error_type'),'error_message': case.get('error_message')} for case in failed_cases[:3]], indent=2, ensure_ascii=False)}
+Please generate new code according to the following requirements:
+1. Make sure to handle all known error types
+2. Enhance the robustness of the code
+3. Keep the code readable
+4. Only return complete Python code without interpretation
+
+Please generate complete, directly executable Python code.
+"""
+
+
+def _improve_programs(args, beam):
+    """
+    Ask for feedback on the programs of the beam, then generate their improved candidates
+
+    The feedback requests, and then all the candidate requests, are each sent at once.
+
+    Returns:
+        The candidate programs of all the beam entries
+    """
+    # use strong LLM to get feedback
+    feedbacks = api_request_many([_feedback_prompt(code, cases) for code, cases in beam],
+                                 model_name=args.model_codegen, use_cache=not args.no_llm_cache)
+    improvement_prompts = []
+    for (code, cases), feedback in zip(beam, feedbacks):
+        if feedback['error'] is not None:
+            logger.error(f"Feedback request failed: {feedback['error']}")
+            continue
+        metrics.add_tokens(feedback['token_prompt'], feedback['token_compli'], cached=feedback['cached'])
+        improvement_prompts.append(_improvement_prompt(code, feedback['response'], cases))
+    if not improvement_prompts:
+        raise ValueError("All feedback requests failed")
+
+    # TODO: use new feedback prompt to generate new code
+    children = generate_candidates(args, improvement_prompts, args.num_candidates)
+    return [code for codes in children for code in codes]
 
 
 def iterative_code_generation(args, processed_data, current_code):
@@ -621,17 +705,31 @@ def iterative_code_generation(args, processed_data, current_code):
     best_accuracy = 0       # best accuracy
     failed_cases = []       # failed cases
     test_sample_size = int(args.test_sample_ratio * len(processed_data))
+    beam_width = max(1, args.beam_width)
+    candidates = [current_code]     # new programs, evaluated in the next iteration
+    parents = []                    # programs of the beam, scored again with the candidates of the next iteration
 
     while cnt < args.max_iterations:
         print(f"{cnt+1}th iteration")
         metrics.start_step(f"iteration_{cnt}")
         # a. Randomly select some samples
         test_samples = random.sample(processed_data, test_sample_size)
-        # b. Evaluate code
-        current_acc, failure_cases = _evaluate_code(current_code, test_samples)
-        metrics.add_iteration(cnt, current_acc, len(failed_cases))
-
-        print(f"The current accuracy is {current_acc:.4f}")
+        # b. Evaluate the beam and its new candidates on the same samples, so their accuracies compare.
+        # Parents mostly run records seen before, which come from the evaluation cache.
+        # Programs that surely cannot beat the best one, or surely clear the target, stop early
+        codes = list(dict.fromkeys(parents + candidates))
+        ranked = _evaluate_candidates(codes, test_samples,
+                                      reject_below=best_accuracy or None, accept_above=args.min_accuacy,
+                                      confidence=args.early_stop_confidence,
+                                      min_records=args.early_stop_min_records,
+                                      use_cache=not args.no_eval_cache)
+        current_acc, current_code, failure_cases, _, _ = ranked[0]
+        evaluated = sum(item[3] for item in ranked)
+        metrics.add_iteration(cnt, current_acc, len(failed_cases), candidates=len(ranked),
+                              evaluated_records=evaluated)
+
+        print(f"The current accuracy is {current_acc:.4f} (best of {len(ranked)} programs, "
+              f"{evaluated}/{len(ranked) * len(test_samples)} records evaluated)")
         logger.info(f"The {cnt+1}th iteration accuracy is {current_acc:.4f}")
 
         # Update best results
@@ -644,7 +742,9 @@ def iterative_code_generation(args, processed_data, current_code):
             print("The accuracy reaches the threshold and the iteration stops.")
             break
         
-        accuracy_improvement = current_acc - prev_accuracy
+        # With a beam the improvement is measured against its parents on the same samples
+        parent_accuracies = [acc for acc, code, _, _, rejected in ranked if code in parents and not rejected]
+        accuracy_improvement = current_acc - (max(parent_accuracies) if parent_accuracies else prev_accuracy)
         if cnt > 0 and accuracy_improvement < args.delta_accuracy:
             print("Accuracy is not improved, stop iteration")
             break
@@ -655,29 +755,14 @@ def iterative_code_generation(args, processed_data, current_code):
             print("No failure cases, continue iteration")
             break
 
-        # use strong LLM to get feedback
-        feedback = _get_llm_feedback(args, current_code, failed_cases) 
-
-        # import ipdb; ipdb.set_trace()
-        # TODO: use new feedback prompt to generate new code
-        improvement_prompt = f"""You are a professional Python code optimization expert. Please generate improved code based on the following information:
-1. Current code:
-```python
-{current_code}
-2. Analyze feedback:
-Improved code based on feedback from:
-{feedback}
-3. Summary of failure cases:
-{json.dumps([{'error_type': case.get('error_type'),'error_message': case.get('error_message')} for case in failed_cases[:3]], indent=2, ensure_ascii=False)}
-Please generate new code according to the following requirements:
-1. Make sure to handle all known error types
-2. Enhance the robustness of the code
-3. Keep the code readable
-4. Only return complete Python code without interpretation
-
-Please generate complete, directly executable Python code.
-"""
-        current_code = generate_code(args, improvement_prompt)
+        # d. Keep the top programs and expand each of them in parallel
+        # With a beam of one only the children are evaluated next, as in the single program loop.
+        # Programs rejected by early stopping take no beam slot, unless no other program is left.
+        kept = [item for item in ranked if not item[4]][:beam_width] or ranked[:1]
+        parents = [code for _, code, _, _, rejected in kept if not rejected] if beam_width > 1 else []
+        beam = [(code, [r for r in cases if not r.get('success')]) for _, code, cases, _, _ in kept]
+        beam = [(code, cases) for code, cases in beam if cases]
+        candidates = _improve_programs(args, beam)
         metrics.end_step(f"iteration_{cnt}")
         # Update iteration parameters
         prev_accuracy = current_acc
@@ -704,6 +789,13 @@ def print_metrics_report(args, metrics: MetricsCollector):
     
     print("\n=== Performance Metrics ===")
     print(f"Total Runtime: {report['execution_metrics']['total_time']}")
+    backend_metrics = report.get("backend_metrics")
+    if backend_metrics:
+        print(f"Backend: {backend_metrics['backend']} ({backend_metrics['calls']} calls, "
+              f"{backend_metrics['call_time']:.2f}s in calls)")
+        if backend_metrics['backend'] == 'http':
+            print(f"HTTP Transport Overhead: {backend_metrics['transport_time']:.2f}s "
+                  f"(saved by --backend local)")
     
     print("\n=== Iteration Summary ===")
     iter_metrics = report["iteration_metrics"]
@@ -717,6 +809,8 @@ def print_metrics_report(args, metrics: MetricsCollector):
         print(f"Iteration {iter_info['iteration']}:")
         print(f"  Accuracy: {iter_info['accuracy']:.4f}")
         print(f"  Failed Cases: {iter_info['failed_cases']}")
+        print(f"  Candidates: {iter_info.get('candidates', 1)}")
+        print(f"  Evaluated Records: {iter_info.get('evaluated_records')}")
         print(f"  Time: {iter_info['timestamp']}")
     
     print("\n=== Token Usage ===")
@@ -724,6 +818,8 @@ def print_metrics_report(args, metrics: MetricsCollector):
     print(f"Prompt Tokens: {token_metrics['total_tokens']['prompt']}")
     print(f"Completion Tokens: {token_metrics['total_tokens']['completion']}")
     print(f"Total Tokens: {token_metrics['total_token_count']}")
+    print(f"Cached Tokens: {token_metrics['cached_token_count']} "
+          f"({token_metrics['cache_hits']}/{token_metrics['llm_calls']} calls served from cache)")
 
     metrics_file = os.path.join(args.output_dir, "metrics.json")
     with open(metrics_file, "w") as f:
@@ -732,16 +828,20 @@ def print_metrics_report(args, metrics: MetricsCollector):
     print(f"\nDetailed metrics have been saved to: {metrics_file}")
 
 def power_instruct():
+    global backend
     args = parse_args()
     print(args)
     metrics.set_config(args)
+    backend = create_backend(args)
 
     # step1: data cleaning
     print_step(1, "Data cleaning")
     metrics.start_step("data_cleaning")
-    data = load_json(args.total_data_dir)
-    data = { 'raw_data': data }
-    processed_data = data_cleaning(args, data)
+    data = load_dataset(args.total_data_dir)
+    if isinstance(data, JsonlDataset):
+        processed_data = clean_dataset(args, data)
+    else:
+        processed_data = data_cleaning(args, { 'raw_data': data })
     metrics.end_step("data_cleaning")
 
     # step2: seed data generation
@@ -761,7 +861,7 @@ def power_instruct():
     print_step(3, "Achieve code generation prompt")
     # 3.1 merge template
     metrics.start_step("initial_code_generation")
-    codegen_prompt = merge_codegen_template(seed_data, std_single_data)
+    codegen_prompt = merge_codegen_template_en(seed_data, std_single_data)
     # generate initial code, here, we use L_strong LLM (such as Claude37, QwenMax)
     current_code = generate_code(args, codegen_prompt)    # 初始化代码
     print(codegen_prompt)
@@ -787,6 +887,7 @@ def power_instruct():
     logger.info(f"Final code accuracy: {best_accuracy}")
     logger.info(f"Final code: {best_code}")
 
+    metrics.set_backend_stats(backend.stats())
     print_metrics_report(args, metrics)
 
 
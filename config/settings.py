@@ -1,11 +1,13 @@
 from pathlib import Path
 import os
+import json
 # Get the project root directory
 BASE_DIR = Path(__file__).parent.parent
 
-# save the system prompts
-TEMPLATE_FOLDER = os.path.join(BASE_DIR, 'data', 'system_prompt')
-TEMPLATE_FILE = os.path.join(TEMPLATE_FOLDER, "user_templates.json")
+# save the system prompts, user templates override the defaults and are reloaded when the file changes
+SYSTEM_PROMPT_FOLDER = os.path.join(BASE_DIR, 'data', 'system_prompt')
+TEMPLATE_FILE = os.getenv('TEMPLATE_FILE', os.path.join(SYSTEM_PROMPT_FOLDER, "user_templates.json"))
+TEMPLATE_HISTORY_SIZE = int(os.getenv('TEMPLATE_HISTORY_SIZE', 10))   # Saved revisions kept per template type
 
 # Set various directory paths
 DATA_FOLDER = os.path.join(BASE_DIR, 'data')
@@ -14,4 +16,75 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, 'data', 'uploads')
 TEMPLATE_FOLDER = os.path.join(BASE_DIR, 'templates')
 STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
 OUTPUT_FOLDER = os.path.join(BASE_DIR, 'output')
-LOGS_FOLDER = os.path.join(BASE_DIR, 'logs')
\ No newline at end of file
+LOGS_FOLDER = os.path.join(BASE_DIR, 'logs')
+
+# Batch executor for the generated code
+EXECUTOR_WORKERS = int(os.getenv('EXECUTOR_WORKERS', os.cpu_count() or 1))    # Number of worker processes
+EXECUTOR_SHARD_SIZE = int(os.getenv('EXECUTOR_SHARD_SIZE', 256))              # Records sent to a worker in one message
+EXECUTOR_START_METHOD = os.getenv('EXECUTOR_START_METHOD', 'spawn')           # Safe to use from a threaded server
+EXECUTOR_RECORD_TIMEOUT = float(os.getenv('EXECUTOR_RECORD_TIMEOUT', 5))      # Seconds allowed for a single record
+EXECUTOR_BATCH_TIMEOUT = float(os.getenv('EXECUTOR_BATCH_TIMEOUT', 3600))     # Seconds allowed for a whole batch
+
+# Persistent cache of the results of generated code, keyed by normalized code and record
+EVAL_CACHE_ENABLED = os.getenv('EVAL_CACHE_ENABLED', '1') == '1'
+EVAL_CACHE_PATH = os.getenv('EVAL_CACHE_PATH', os.path.join(DATA_FOLDER, 'cache', 'eval_cache.sqlite'))
+EVAL_CACHE_MAX_BYTES = int(os.getenv('EVAL_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # Least recently used entries are evicted above this size
+
+# Zip uploads, JSON members are parsed in worker processes and merged into one dataset
+ZIP_INGEST_WORKERS = int(os.getenv('ZIP_INGEST_WORKERS', os.cpu_count() or 1))  # Parser processes
+ZIP_INGEST_SHARD_SIZE = int(os.getenv('ZIP_INGEST_SHARD_SIZE', 500))          # Members parsed by a worker in one task
+ZIP_INGEST_PARALLEL_MIN = int(os.getenv('ZIP_INGEST_PARALLEL_MIN', 2000))     # Smaller archives are parsed in the server process
+
+# JSON encoding of responses and result files
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')                              # 'auto' uses orjson when installed, 'stdlib' never does
+JSON_COMPACT_FILES = os.getenv('JSON_COMPACT_FILES', '1') == '1'              # Write result files without indentation
+
+# Record offset indexes of the dataset files served page by page by /api/json-content
+RECORD_INDEX_CACHE_SIZE = int(os.getenv('RECORD_INDEX_CACHE_SIZE', 32))       # Dataset files whose index is kept in memory
+JSON_CONTENT_MAX_LIMIT = int(os.getenv('JSON_CONTENT_MAX_LIMIT', 1000))       # Records returned in one page at most
+
+# Data cleaning rules used by /clean, a request may override them
+CLEAN_TRIM = os.getenv('CLEAN_TRIM', '1') == '1'                              # Strip leading and trailing whitespace
+CLEAN_REMOVE_NEWLINES = os.getenv('CLEAN_REMOVE_NEWLINES', '1') == '1'        # Replace line breaks with a space
+CLEAN_NULLS = os.getenv('CLEAN_NULLS', 'empty')                               # None values: 'empty' string, 'keep' or 'drop' the field
+CLEAN_COERCE_NUMERIC = os.getenv('CLEAN_COERCE_NUMERIC', '0') == '1'          # Turn numeric strings like "0.534" into floats
+CLEAN_NESTED = os.getenv('CLEAN_NESTED', '0') == '1'                          # Also clean values inside nested objects and lists
+CLEAN_CHUNK_SIZE = int(os.getenv('CLEAN_CHUNK_SIZE', 2000))                   # Records cleaned together
+CLEAN_SPOOL_MAX_MEMORY = int(os.getenv('CLEAN_SPOOL_MAX_MEMORY', 16 * 1024 * 1024))  # Cleaned NDJSON kept in memory before spilling to disk
+
+# Background batch jobs
+JOB_FOLDER = os.path.join(DATA_FOLDER, 'jobs')                                # Persisted job state and results
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))                                # Jobs running at the same time
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))                        # Jobs waiting to run
+
+# LLM provider clients, shared by all requests
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 100))              # Connections per provider client
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', 20))  # Idle connections kept open
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 600))                            # Seconds for a whole request
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 10))             # Seconds to open a connection
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 0))                        # Retries done by the provider SDK, see LLM_REQUEST_RETRIES
+
+# Concurrent LLM requests allowed per provider by the async request engine
+LLM_CONCURRENCY = {
+    'qwen': int(os.getenv('LLM_CONCURRENCY_QWEN', 16)),
+    'openai': int(os.getenv('LLM_CONCURRENCY_OPENAI', 16)),
+    'anthropic': int(os.getenv('LLM_CONCURRENCY_ANTHROPIC', 8)),
+}
+
+# Requests and tokens per minute allowed per provider, 0 disables a limit. Limits of single
+# models can be added with LLM_MODEL_RATE_LIMITS='{"qwen-max": {"rpm": 60, "tpm": 100000}}'
+LLM_RATE_LIMITS = {
+    'qwen': {'rpm': int(os.getenv('LLM_RPM_QWEN', 600)), 'tpm': int(os.getenv('LLM_TPM_QWEN', 1000000))},
+    'openai': {'rpm': int(os.getenv('LLM_RPM_OPENAI', 500)), 'tpm': int(os.getenv('LLM_TPM_OPENAI', 300000))},
+    'anthropic': {'rpm': int(os.getenv('LLM_RPM_ANTHROPIC', 50)), 'tpm': int(os.getenv('LLM_TPM_ANTHROPIC', 40000))},
+}
+LLM_MODEL_RATE_LIMITS = json.loads(os.getenv('LLM_MODEL_RATE_LIMITS', '{}'))
+LLM_REQUEST_RETRIES = int(os.getenv('LLM_REQUEST_RETRIES', 5))                # Retries of rate limited or failed model calls
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1.0))                  # Seconds, doubled on every retry
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 60.0))                   # Upper bound of a single backoff
+
+# Persistent cache of LLM responses
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') == '1'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(DATA_FOLDER, 'cache', 'llm_cache.sqlite'))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # Least recently used entries are evicted above this size
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))              # Seconds before an entry expires
@@ -6,7 +6,11 @@ from config.settings import LOGS_FOLDER, OUTPUT_FOLDER
 os.makedirs(LOGS_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-app = create_app()
+DEBUG = True
+
+# With the debug reloader, requests are served by a child process started with WERKZEUG_RUN_MAIN set,
+# the watching parent process does not run jobs
+app = create_app(start_jobs=not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5005, debug=True)
+    app.run(host='0.0.0.0', port=5005, debug=DEBUG)
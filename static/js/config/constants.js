@@ -19,6 +19,9 @@ export const API_ENDPOINTS = {
     MERGE_TEMPLATE: '/merge_template'
 };
 
+// Records shown when previewing a dataset file
+export const JSON_PREVIEW_LIMIT = 100;
+
 export const MODES = {
     PROMPT_CODEGEN: 'prompt-codegen',
     PROMPT: 'prompt',
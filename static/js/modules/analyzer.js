@@ -188,8 +188,15 @@ export class Analyzer {
             this.updateButtonStates(true);
             this.state.loadingInterval = UIHelper.showLoading(this.codegenOutput);
 
-            // Send code generation request
-            const response = await apiService.analyzeFile(codegenData);
+            // Send code generation request, the code is shown while it is generated
+            let streamed = '';
+            const response = await apiService.analyzeFileStream(codegenData, (content) => {
+                if (!streamed) {
+                    UIHelper.clearLoading(this.state.loadingInterval);
+                }
+                streamed += content;
+                this.codegenOutput.textContent = streamed;
+            });
 
             if (response.data.code === 200) {
                 // Handle successful response
@@ -409,15 +416,16 @@ export class Analyzer {
         try {
             this.updateProcessStatus('Reading data file...');
             // console.log('Selecting random seed from file:', filePath);
-            const response = await apiService.fetchJsonContent(filePath);
-            // console.log('File content:', response.data.data);
-            if (!response.data || !response.data.data) {
+            // Ask for the record count only, then fetch the one record picked
+            const countResponse = await apiService.fetchJsonContent(filePath, { offset: 0, limit: 0 });
+            const total = countResponse.data && countResponse.data.total;
+            if (!total) {
                 throw new Error('Invalid data format in file');
             }
 
-            const allData = response.data.data;
-            const randomIndex = Math.floor(Math.random() * allData.length);
-            const selectedData = allData[randomIndex];
+            const randomIndex = Math.floor(Math.random() * total);
+            const response = await apiService.fetchJsonContent(filePath, { offset: randomIndex, limit: 1 });
+            const selectedData = response.data.data[0];
             this.updateProcessStatus(`Selected seed data (index: ${randomIndex})`);
             this.selectedData = selectedData;
             return selectedData;
@@ -1,6 +1,7 @@
 import { FileValidator } from '../utils/validators.js';
 import { UIHelper } from '../utils/uiHelpers.js';
 import { apiService } from '../utils/apiService.js';
+import { JSON_PREVIEW_LIMIT } from '../config/constants.js';
 
 export class FileUploader {
     constructor(config) {
@@ -165,7 +166,7 @@ export class FileUploader {
 
     async fetchAndPreviewJson(filePath) {
         try {
-            const response = await apiService.fetchJsonContent(filePath);
+            const response = await apiService.fetchJsonContent(filePath, { offset: 0, limit: JSON_PREVIEW_LIMIT });
             if (response.data) {
                 this.jsonViewer.show(response.data);
             }
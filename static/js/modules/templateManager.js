@@ -119,7 +119,7 @@ export class TemplateManager {
 
             const response = await apiService.saveTemplate({
                 type: this.currentMode,
-                content: this.content
+                content: content
             });
 
             if (response.data.success) {
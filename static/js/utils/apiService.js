@@ -75,8 +75,9 @@ export class APIService {
         return this.axios.get(API_ENDPOINTS.TEMPLATES);
     }
 
-    async fetchJsonContent(filePath) {
-        return await axios.get(`/api/json-content?path=${encodeURIComponent(filePath)}`);
+    // params: offset, limit and fields (comma separated, dotted for nested fields)
+    async fetchJsonContent(filePath, params = {}) {
+        return await axios.get('/api/json-content', { params: { path: filePath, ...params } });
     }
 
     async saveTemplate(templateData) {
@@ -87,6 +88,45 @@ export class APIService {
         return this.axios.post(API_ENDPOINTS.ANALYZE, analyzeData);
     }
 
+    // Streaming /analyze: onDelta receives the text as it is generated, the result has the same
+    // shape as analyzeFile's response once the `done` event arrives
+    async analyzeFileStream(analyzeData, onDelta) {
+        const response = await fetch(API_ENDPOINTS.ANALYZE, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...analyzeData, stream: true })
+        });
+        if (!response.ok || !response.body) {
+            throw { message: `Server Error (${response.status})`, status: response.status };
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const event = (block.match(/^event: (.*)$/m) || [])[1];
+                const data = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || '{}');
+
+                if (event === 'delta') {
+                    onDelta(data.content);
+                } else if (event === 'done') {
+                    return { data };
+                } else if (event === 'error') {
+                    throw { message: data.message || 'Server Error', status: data.code };
+                }
+            }
+        }
+        throw { message: 'The analysis stream ended unexpectedly', status: 0 };
+    }
+
     async executeCode(codeData) {
         return this.axios.post(API_ENDPOINTS.EXECUTE, codeData);
     }
@@ -205,7 +205,7 @@ export class UIHelper {
                         fileItem.remove();
                         
                         // Remove the file from the files array
-                        const fileIndex = files.findIndex(f => f.path === filePath);
+                        const fileIndex = files.findIndex(f => f.relative_path === filePath);
                         if (fileIndex !== -1) {
                             files.splice(fileIndex, 1);
                         }
@@ -1,37 +1,315 @@
 # qwen_api_key
 
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import httpx
+import openai
 from openai import OpenAI
-from typing import Optional, Union, List
+from typing import Optional, Union, List, Dict, Any, Iterator, Callable, Tuple
 import anthropic
+from config.settings import (LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_TIMEOUT,
+                             LLM_CONNECT_TIMEOUT, LLM_MAX_RETRIES, LLM_CONCURRENCY, LLM_CACHE_ENABLED,
+                             LLM_REQUEST_RETRIES)
+from utils.llm_cache import get_response_cache, cache_key
+from utils.rate_limiter import get_rate_limiter, estimate_tokens, backoff_delay, retry_after_seconds
+from utils.logger import logger
 
 # Here we put a temporal Qwen-Series api key for test, please replace it with your own api key.
 # If you want to use other models, please replace the api key and base url with your own.
 # Supported Model List: ['qwen-max', 'qwen-coder-plus', 'qwen2.5-7b-instruct']
-os.environ["DASHSCOPE_API_KEY"] = 'sk-658896d9b7754ca69fa869308704606d'
-os.environ["DASHSCOPE_BASE_URL"] = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+os.environ.setdefault("DASHSCOPE_API_KEY", 'sk-658896d9b7754ca69fa869308704606d')
+os.environ.setdefault("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 
 qwen_series_model = ['qwen-max', 'qwen-coder-plus', 'qwen2.5-7b-instruct']
 openai_series_model = ['o1-preview-0912', 'o1-mini-0912', 'gpt-4o-0806', 'gpt-4o-mini', 'o1-mini', 'o1', 'gpt-4o']
 anthropic_series_model = ['claude-3-7-sonnet-20250219', 'claude-3-5-sonnet-20241022']
 
+# Provider clients, one per provider and credential set. They are shared by all requests
+# and threads, so their keep-alive connection pools are reused instead of rebuilt per call.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(provider: str, api_key: Optional[str], base_url: Optional[str] = None):
+    """
+    Get the shared client of a provider, created on first use
+
+    Args:
+        provider: 'qwen', 'openai' or 'anthropic'
+        api_key: API key of the credential set
+        base_url: API base url, None for the provider default
+
+    Returns:
+        An OpenAI or anthropic.Anthropic client
+    """
+    key = (provider, api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                  max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS)
+            timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            if provider == 'anthropic':
+                client = anthropic.Anthropic(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=anthropic.DefaultHttpxClient(limits=limits, timeout=timeout),
+                )
+            else:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=openai.DefaultHttpxClient(limits=limits, timeout=timeout),
+                )
+            _clients[key] = client
+        return client
+
+def get_provider(model_name: str) -> str:
+    """Provider serving a model: 'qwen', 'openai' or 'anthropic'"""
+    if model_name in qwen_series_model:
+        return 'qwen'
+    elif model_name in openai_series_model:
+        return 'openai'
+    elif model_name in anthropic_series_model:
+        return 'anthropic'
+    else:
+        raise ValueError(f"model_name: {model_name} is not in the qwen_series_model list.")
+
 def api_request(
     prompt: str,
     model_name: str='qwen-plus',
+    use_cache: bool=True,
     **kwargs
     ):
+    response, token_prompt, token_compli, _ = api_request_cached(prompt, model_name, use_cache=use_cache, **kwargs)
+    return response, token_prompt, token_compli
 
-    if model_name in qwen_series_model:
-        response, token_prompt, token_compli = qwen_request(prompt=prompt, model_name=model_name)
-        return response, token_prompt, token_compli
-    elif model_name in openai_series_model:
-        response, token_prompt, token_compli = openai_request(prompt=prompt, model_name=model_name)
-        return response, token_prompt, token_compli
-    elif model_name in anthropic_series_model:
-        response, token_prompt, token_compli = anthropic_request(prompt=prompt, model_name=model_name)
-        return response, token_prompt, token_compli
+def api_request_cached(
+    prompt: str,
+    model_name: str='qwen-plus',
+    use_cache: bool=True,
+    **kwargs
+    ):
+    """
+    api_request backed by the persistent response cache
+
+    The cache is keyed by provider, model, normalized prompt and the remaining keyword
+    (sampling) parameters, which are sent to the provider. Pass use_cache=False to always
+    send the request.
+
+    Returns:
+        (response, token_prompt, token_compli, cached), `cached` tells whether the
+        response and its token counts come from the cache
+    """
+    provider = get_provider(model_name)
+    cache = get_response_cache() if use_cache and LLM_CACHE_ENABLED else None
+    key = cache_key(provider, model_name, prompt, kwargs) if cache else None
+    if cache:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit[0], hit[1], hit[2], True
+
+    if provider == 'qwen':
+        request_fn = qwen_request
+    elif provider == 'openai':
+        request_fn = openai_request
     else:
-        raise ValueError(f"model_name: {model_name} is not in the qwen_series_model list.")
+        request_fn = anthropic_request
+    reserved = estimate_tokens(prompt)
+    response, token_prompt, token_compli = _call_with_retries(
+        partial(request_fn, prompt=prompt, model_name=model_name, **kwargs), provider, model_name, reserved)
+    get_rate_limiter().settle(provider, model_name, reserved, (token_prompt or 0) + (token_compli or 0))
+
+    # Only plain text answers are stored, empty answers are retried by the callers
+    if cache and isinstance(response, str) and response:
+        cache.put(key, response, token_prompt, token_compli)
+    return response, token_prompt, token_compli, False
+
+
+# Errors worth retrying, anything else (bad request, authentication, ...) fails at once
+RETRYABLE_ERRORS = (
+    openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError,
+    anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError,
+)
+RATE_LIMIT_ERRORS = (openai.RateLimitError, anthropic.RateLimitError)
+
+def _call_with_retries(call, provider: str, model_name: str, reserved: int):
+    """
+    Run one model call through the shared rate limiter, retrying rate limited and transient failures
+
+    Retries wait for the Retry-After time given by the provider, or else an exponential backoff
+    with jitter. A rate limited answer also pauses the other callers of the same model. The
+    `reserved` token estimate is left to the caller to settle once the real usage is known.
+    """
+    limiter = get_rate_limiter()
+    for attempt in range(LLM_REQUEST_RETRIES + 1):
+        limiter.acquire(provider, model_name, reserved)
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            limiter.settle(provider, model_name, reserved, 0)
+            if attempt >= LLM_REQUEST_RETRIES:
+                raise
+            retry_after = retry_after_seconds(e)
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            if isinstance(e, RATE_LIMIT_ERRORS):
+                limiter.pause(provider, model_name, delay)
+            logger.warning(f"{type(e).__name__} from {provider}/{model_name}, "
+                           f"retry {attempt + 1}/{LLM_REQUEST_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+
+def api_request_stream(
+    prompt: str,
+    model_name: str='qwen-plus',
+    use_cache: bool=True,
+    **kwargs
+    ) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming api_request, yields the answer while the provider generates it
+
+    Yields:
+        {'type': 'delta', 'content': ...} for every piece of text, then one
+        {'type': 'done', 'response', 'token_prompt', 'token_compli', 'cached'} with the whole
+        answer and its usage. A cached answer is sent as a single delta.
+    """
+    provider = get_provider(model_name)
+    cache = get_response_cache() if use_cache and LLM_CACHE_ENABLED else None
+    key = cache_key(provider, model_name, prompt, kwargs) if cache else None
+    if cache:
+        hit = cache.get(key)
+        if hit is not None:
+            yield {'type': 'delta', 'content': hit[0]}
+            yield {'type': 'done', 'response': hit[0], 'token_prompt': hit[1], 'token_compli': hit[2], 'cached': True}
+            return
+
+    stream_fn = anthropic_stream if provider == 'anthropic' else chat_stream
+    reserved = estimate_tokens(prompt)
+    # Only opening the stream is retried, text that was already sent cannot be taken back
+    stream = _call_with_retries(partial(stream_fn, provider, prompt=prompt, model_name=model_name, **kwargs),
+                                provider, model_name, reserved)
+    pieces = []
+    token_prompt, token_compli = 0, 0
+    try:
+        for kind, *values in stream:
+            if kind == 'delta':
+                pieces.append(values[0])
+                yield {'type': 'delta', 'content': values[0]}
+            else:
+                token_prompt, token_compli = values
+    finally:
+        get_rate_limiter().settle(provider, model_name, reserved, token_prompt + token_compli)
+
+    response = ''.join(pieces)
+    if cache and response:
+        cache.put(key, response, token_prompt, token_compli)
+    yield {'type': 'done', 'response': response, 'token_prompt': token_prompt, 'token_compli': token_compli,
+           'cached': False}
+
+
+# One executor per provider, sized to its concurrency limit. The blocking requests run on
+# the shared pooled clients, so the limit holds across event loops and calling threads.
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _get_executor(provider: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(provider)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max(1, LLM_CONCURRENCY.get(provider, 8)),
+                                          thread_name_prefix=f"llm-{provider}")
+            _executors[provider] = executor
+        return executor
+
+async def run_limited_async(provider: str, call: Callable[[], Any]):
+    """Run a blocking call on the executor of a provider, at most LLM_CONCURRENCY[provider] run at once"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(provider), call)
+
+async def run_many_async(calls: List[Tuple[str, Callable[[], Any]]]) -> List[Dict[str, Any]]:
+    """
+    Run blocking calls concurrently, each bounded by the concurrency limit of its provider
+
+    The calls must not wait on other calls of the engine, they would hold a slot of the executor
+    they wait on.
+
+    Args:
+        calls: (provider, call) pairs, `call` takes no arguments
+
+    Returns:
+        One dict per call, in input order, with `result`, `error` and `error_type`. A failed call
+        has `error` set and does not affect the others.
+    """
+    async def run_one(provider, call):
+        try:
+            return {'result': await run_limited_async(provider, call), 'error': None, 'error_type': None}
+        except Exception as e:
+            return {'result': None, 'error': str(e), 'error_type': type(e).__name__}
+
+    return await asyncio.gather(*(run_one(provider, call) for provider, call in calls))
+
+def run_many(calls: List[Tuple[str, Callable[[], Any]]]) -> List[Dict[str, Any]]:
+    """Blocking version of run_many_async for synchronous callers"""
+    coroutine = run_many_async(calls)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Called from inside a running event loop, run on a separate thread with its own loop
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+async def api_request_async(
+    prompt: str,
+    model_name: str='qwen-plus',
+    **kwargs
+    ):
+    """Awaitable api_request_cached, bounded by the concurrency limit of the model's provider"""
+    return await run_limited_async(get_provider(model_name),
+                                   partial(api_request_cached, prompt, model_name, **kwargs))
+
+def _request_call(prompt: str, model_name: str, kwargs: Dict[str, Any]):
+    def call():
+        response, token_prompt, token_compli, cached = api_request_cached(prompt, model_name, **kwargs)
+        return {'response': response, 'token_prompt': token_prompt, 'token_compli': token_compli,
+                'cached': cached}
+    return call
+
+def _request_results(outcomes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    failed = {'response': None, 'token_prompt': 0, 'token_compli': 0, 'cached': False}
+    return [{**(outcome['result'] or failed), 'error': outcome['error'], 'error_type': outcome['error_type']}
+            for outcome in outcomes]
+
+async def api_request_many_async(
+    prompts: List[str],
+    model_name: str='qwen-plus',
+    **kwargs
+    ) -> List[Dict[str, Any]]:
+    """
+    Send many prompts concurrently, through the response cache unless use_cache=False is passed
+
+    Returns:
+        One dict per prompt, in input order, with `response`, `token_prompt`, `token_compli`,
+        `cached`, `error` and `error_type`. A failed prompt has `error` set and does not affect the others.
+    """
+    provider = get_provider(model_name)
+    outcomes = await run_many_async([(provider, _request_call(prompt, model_name, kwargs)) for prompt in prompts])
+    return _request_results(outcomes)
+
+def api_request_many(
+    prompts: List[str],
+    model_name: str='qwen-plus',
+    **kwargs
+    ) -> List[Dict[str, Any]]:
+    """Blocking version of api_request_many_async for synchronous callers"""
+    provider = get_provider(model_name)
+    return _request_results(run_many([(provider, _request_call(prompt, model_name, kwargs)) for prompt in prompts]))
 
 
 def qwen_request(
@@ -39,10 +317,7 @@ def qwen_request(
     model_name: str='qwen-plus',
     **kwargs
     ):
-    client = OpenAI(
-        api_key=os.getenv("DASHSCOPE_API_KEY"), 
-        base_url=os.getenv("DASHSCOPE_BASE_URL"),
-    )
+    client = get_client('qwen', api_key=os.getenv("DASHSCOPE_API_KEY"), base_url=os.getenv("DASHSCOPE_BASE_URL"))
     # Here we take qwen-plus as an example, and the model name can be changed as needed. 
     # Model list: https://help.aliyun.com/zh/model-studio/models
     completion = client.chat.completions.create(
@@ -50,6 +325,7 @@ def qwen_request(
         messages=[
             {'role': 'system', 'content': 'You are a helpful assistant.'},
             {'role': 'user', 'content': prompt}],
+        **kwargs
         )
     response = completion.choices[0].message.content
     token_prompt = completion.usage.prompt_tokens
@@ -65,7 +341,7 @@ def openai_request(
     ):
     api_key = os.getenv("OPENAI_API_KEY")
     base_url = os.getenv("OPENAI_BASE_URL")
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    client = get_client('openai', api_key=api_key, base_url=base_url)
     # Here we take gpt-4o as an example, and the model name can be changed as needed. 
     # Model list: https://platform.openai.com/docs/pricing
     if isinstance(system_message, str):
@@ -89,6 +365,74 @@ def openai_request(
     return response, 0, 0
 
 
+def chat_stream(
+    provider: str,
+    prompt: str,
+    model_name: str='qwen-plus',
+    system_message: str="You are a helpful assistant.",
+    **kwargs
+    ):
+    """
+    Open a streaming chat completion on a Qwen or OpenAI compatible endpoint
+
+    The request is sent before this returns, so connection and rate limit errors raise here.
+
+    Returns:
+        Iterator of ('delta', text) tuples, followed by ('usage', token_prompt, token_compli)
+    """
+    if provider == 'qwen':
+        client = get_client('qwen', api_key=os.getenv("DASHSCOPE_API_KEY"), base_url=os.getenv("DASHSCOPE_BASE_URL"))
+    else:
+        client = get_client('openai', api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+    stream = client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {'role': 'system', 'content': system_message},
+            {'role': 'user', 'content': prompt}],
+        stream=True,
+        stream_options={'include_usage': True},
+        **kwargs
+        )
+
+    def events():
+        token_prompt, token_compli = 0, 0
+        with stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield 'delta', chunk.choices[0].delta.content
+                if chunk.usage:
+                    token_prompt, token_compli = chunk.usage.prompt_tokens, chunk.usage.completion_tokens
+        yield 'usage', token_prompt, token_compli
+
+    return events()
+
+def anthropic_stream(
+    provider: str,
+    prompt: str,
+    model_name: str='claude-3-5-sonnet-20241022',
+    max_tokens_to_sample: Optional[int] = 1024,
+    **kwargs
+    ):
+    """Streaming anthropic_request, same events as chat_stream (the completions API reports no usage)"""
+    client = get_client('anthropic', api_key=os.getenv("ANTHROPIC_API_KEY"), base_url=os.getenv("ANTHROPIC_BASE_URL"))
+    stream = client.completions.create(
+        prompt=f"{anthropic.HUMAN_PROMPT} {prompt} {anthropic.AI_PROMPT}",
+        model=model_name,
+        max_tokens_to_sample=max_tokens_to_sample,
+        stream=True,
+        **kwargs
+    )
+
+    def events():
+        with stream:
+            for event in stream:
+                if event.completion:
+                    yield 'delta', event.completion
+        yield 'usage', 0, 0
+
+    return events()
+
+
 def anthropic_request(
     prompt: str,
     model_name: str='claude-3-5-sonnet-20241022',
@@ -96,13 +440,14 @@ def anthropic_request(
     **kwargs
     ):
     api_key = os.getenv("ANTHROPIC_API_KEY")
-    client = anthropic.Anthropic(api_key=api_key)
+    client = get_client('anthropic', api_key=api_key, base_url=os.getenv("ANTHROPIC_BASE_URL"))
     # Here we take claude-3-5-sonnet as an example, and the model name can be changed as needed. 
     # Model list: https://docs.anthropic.com/en/docs/about-claude/models/all-models
     response = client.completions.create(
         prompt=f"{anthropic.HUMAN_PROMPT} {prompt} {anthropic.AI_PROMPT}",
         model=model_name,
         max_tokens_to_sample=max_tokens_to_sample,
+        **kwargs
     )
     output = response.completion.strip()
     return output, 0, 0
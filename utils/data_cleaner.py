@@ -0,0 +1,163 @@
+import re
+import math
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Callable, Iterable, Iterator
+from config.settings import (CLEAN_TRIM, CLEAN_REMOVE_NEWLINES, CLEAN_NULLS, CLEAN_COERCE_NUMERIC,
+                             CLEAN_NESTED, CLEAN_CHUNK_SIZE)
+from utils.logger import logger
+from utils import json_serializer
+
+NULL_MODES = ('empty', 'keep', 'drop')
+_DROP = object()        # Marks a field removed by the 'drop' null mode
+_DIGITS = frozenset('0123456789.')
+# Plain ASCII decimals, float() alone would also take '1_0' (as 10.0) and non-ASCII digits
+_NUMBER = re.compile(r'\s*[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?\s*')
+
+
+@dataclass
+class CleaningRules:
+    trim: bool = CLEAN_TRIM
+    remove_newlines: bool = CLEAN_REMOVE_NEWLINES
+    nulls: str = CLEAN_NULLS
+    coerce_numeric: bool = CLEAN_COERCE_NUMERIC
+    nested: bool = CLEAN_NESTED
+
+    def __post_init__(self):
+        if self.nulls not in NULL_MODES:
+            raise ValueError(f"Invalid null handling '{self.nulls}', expected one of {', '.join(NULL_MODES)}")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any] = None) -> 'CleaningRules':
+        """Rules from a request body or query string, unknown keys are ignored"""
+        kwargs = {}
+        for name, default in asdict(cls()).items():
+            if not data or name not in data:
+                continue
+            value = data[name]
+            if isinstance(default, bool) and isinstance(value, str):
+                value = value.strip().lower() in ('1', 'true', 'yes', 'on')
+            kwargs[name] = type(default)(value)
+        return cls(**kwargs)
+
+
+def make_cleaner(rules: CleaningRules) -> Callable[[Any], Any]:
+    """Value cleaning function specialized for the rules, so each value only pays for the enabled steps"""
+    steps = []
+    if rules.trim:
+        steps.append(str.strip)
+    if rules.remove_newlines:
+        steps.append(lambda value: value.replace("\n", " ").replace("\r", "") if "\n" in value or "\r" in value else value)
+    if rules.coerce_numeric:
+        def coerce(value):
+            if not value or value[-1] not in _DIGITS or not _NUMBER.fullmatch(value):
+                return value
+            number = float(value)
+            return number if math.isfinite(number) else value
+        steps.append(coerce)
+    null_value = {'empty': '', 'drop': _DROP, 'keep': None}[rules.nulls]
+
+    def clean_value(value):
+        if value is None:
+            return null_value
+        if value.__class__ is str:
+            for step in steps:
+                if value.__class__ is not str:
+                    break
+                value = step(value)
+        return value
+    return clean_value
+
+def _clean_dict(node: Dict[str, Any], clean_value: Callable[[Any], Any], nested: bool):
+    """Clean the values of a dict in place, with `nested` also those of the dicts and lists in it"""
+    dropped = []
+    for key, value in node.items():
+        if nested and isinstance(value, dict):
+            _clean_dict(value, clean_value, nested)
+            continue
+        if nested and isinstance(value, list):
+            _clean_list(value, clean_value)
+            continue
+        value = clean_value(value)
+        if value is _DROP:
+            dropped.append(key)
+        else:
+            node[key] = value
+    for key in dropped:
+        del node[key]
+
+def _clean_list(items: List[Any], clean_value: Callable[[Any], Any]):
+    """Clean the items of a nested list in place, 'drop' removes null items"""
+    cleaned = []
+    for item in items:
+        if isinstance(item, dict):
+            _clean_dict(item, clean_value, True)
+        elif isinstance(item, list):
+            _clean_list(item, clean_value)
+        else:
+            item = clean_value(item)
+            if item is _DROP:
+                continue
+        cleaned.append(item)
+    items[:] = cleaned
+
+def clean_records(records: List[Any], rules: CleaningRules = None) -> List[Dict[str, Any]]:
+    """
+    Clean the top-level values of records in place, nested dicts and lists too with `rules.nested`
+
+    Args:
+        records: parsed records, items that are not dicts are skipped
+        rules: cleaning rules, the configured defaults if not given
+
+    Returns:
+        The cleaned dict records
+    """
+    rules = rules or CleaningRules()
+    clean_value = make_cleaner(rules)
+    cleaned = []
+    for item in records:
+        if isinstance(item, dict):
+            _clean_dict(item, clean_value, rules.nested)
+            cleaned.append(item)
+        else:
+            logger.warning(f"Skipping non-dict item: {item}")
+    return cleaned
+
+def iter_ndjson(lines: Iterable) -> Iterator[Any]:
+    """Parse NDJSON lines (str or bytes), blank lines are skipped"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json_serializer.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {number}: {str(e)}")
+
+def clean_ndjson(lines: Iterable, target, rules: CleaningRules = None, chunk_size: int = CLEAN_CHUNK_SIZE) -> int:
+    """
+    Clean NDJSON records chunk by chunk and write them as NDJSON
+
+    Args:
+        lines: NDJSON input lines
+        target: binary file the cleaned records are written to
+        rules: cleaning rules
+        chunk_size: records cleaned together
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+    chunk = []
+
+    def flush():
+        cleaned = clean_records(chunk, rules)
+        target.write(b''.join(json_serializer.dumps_bytes(record) + b"\n" for record in cleaned))
+        chunk.clear()
+        return len(cleaned)
+
+    for record in iter_ndjson(lines):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            count += flush()
+    if chunk:
+        count += flush()
+    return count
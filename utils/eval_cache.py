@@ -0,0 +1,140 @@
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+from config.settings import EVAL_CACHE_PATH, EVAL_CACHE_MAX_BYTES
+from utils.logger import logger
+
+# Part of every key, bump it when the sandbox or the entry format changes so old results are not reused
+EVAL_CACHE_VERSION = 2
+# Eviction frees space down to this share of the limit, so it does not run on every write
+EVICT_TARGET = 0.9
+
+
+def code_fingerprint(code: str) -> str:
+    """
+    Hash of the generated code that ignores formatting and comments
+
+    The code is hashed through its AST dump, code that does not parse is hashed as is.
+    """
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except (SyntaxError, ValueError):
+        normalized = code.strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def record_hash(record: Any) -> str:
+    """Content hash of an input record, independent of its key order"""
+    content = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def eval_key(fingerprint: str, record: Any) -> str:
+    return f"{EVAL_CACHE_VERSION}:{fingerprint}:{record_hash(record)}"
+
+
+class EvalCache:
+    """
+    Results of (code, record) pairs stored in a local SQLite file
+
+    Values are the JSON encoded entry fields without the input record. When the stored
+    values exceed `max_bytes`, the least recently used ones are evicted down to 90% of it.
+    """
+    def __init__(self, path: str = EVAL_CACHE_PATH, max_bytes: int = EVAL_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)')
+        self.conn.commit()
+        self.size = self._total_size()
+
+    def _total_size(self) -> int:
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored values of the keys that are present"""
+        found = {}
+        now = time.time()
+        with self.lock:
+            # Stay below SQLite's limit of bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT key, value FROM results WHERE key IN ({placeholders})', chunk)
+                found.update((key, json.loads(value)) for key, value in rows)
+                hit_keys = [key for key in chunk if key in found]
+                if hit_keys:
+                    self.conn.executemany('UPDATE results SET accessed_at = ? WHERE key = ?',
+                                          [(now, key) for key in hit_keys])
+            self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Dict[str, Any]]]):
+        now = time.time()
+        rows = []
+        for key, value in items:
+            encoded = json.dumps(value, ensure_ascii=False)
+            rows.append((key, encoded, len(encoded.encode('utf-8')), now))
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', rows)
+            self.size += sum(row[2] for row in rows)
+            if self.size > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries until the size is back under the target"""
+        self.size = self._total_size()
+        target = self.max_bytes * EVICT_TARGET
+        if self.size <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute('SELECT key, size FROM results ORDER BY accessed_at').fetchall():
+            if self.size <= target:
+                break
+            self.conn.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.size -= size
+            evicted += 1
+        logger.info(f"Evaluation cache evicted {evicted} entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'size_bytes': size
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_eval_cache() -> EvalCache:
+    """Get the process-wide evaluation cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EvalCache()
+        return _cache
@@ -0,0 +1,501 @@
+import copy
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Iterator, Optional
+from config.settings import (EXECUTOR_WORKERS, EXECUTOR_SHARD_SIZE, EXECUTOR_START_METHOD,
+                             EXECUTOR_RECORD_TIMEOUT, EXECUTOR_BATCH_TIMEOUT, EVAL_CACHE_ENABLED)
+from utils.logger import logger
+from utils.eval_cache import get_eval_cache, code_fingerprint, eval_key
+from utils.run_python_utils import (TimeoutException, ScopedWriter, load_generate_instruction, format_output,
+                                    structured_output)
+
+
+class CodeExecutor:
+    """
+    Compile the generated code once and call generate_instruction for each record
+
+    The generated module is compiled and executed a single time in a sandbox namespace,
+    every record is then passed directly to the extracted generate_instruction function
+    instead of being pasted into a new source string and re-compiled. The print output
+    of every call is captured separately, so run_single is safe to call from several threads.
+    """
+    def __init__(self, executed_code: str):
+        self.executed_code = executed_code
+        self.writer = ScopedWriter()
+        self.load_error = None
+        self.load_timeout = None
+        self.generate_instruction = None
+        try:
+            self.generate_instruction = load_generate_instruction(executed_code, self.writer)
+        except TimeoutException as e:
+            # Raised again for every record, so it is reported as a transient failure and not cached
+            logger.error(f"Loading the generated code timed out: {str(e)}")
+            self.load_timeout = e
+        except Exception as e:
+            logger.error(f"Failed to load generated code: {str(e)}")
+            self.load_error = f"Code execution error: {str(e)}"
+
+    def run_single(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute the code for a single piece of data, add data validation and error handling
+
+        Args:
+            input_data: input data
+
+        Returns:
+            Processing results
+        """
+        try:
+            # 1. Data Validation
+            if not input_data or not isinstance(input_data, dict):
+                raise ValueError("Invalid input data")
+
+            # 2. Get the actual data (because the previous select_random_data returned a dictionary with id)
+            actual_data = input_data.get('data') if 'data' in input_data else input_data
+
+            # 3. Executing Code
+            if self.load_timeout is not None:
+                raise TimeoutException(f"Loading the generated code timed out: {str(self.load_timeout)}")
+            if self.load_error:
+                return {
+                    'code': 500,
+                    'success': False,
+                    'error': self.load_error,
+                    'input_data': actual_data
+                }
+
+            try:
+                with self.writer.capture() as output:
+                    # The generated code gets its own copy, so it cannot modify the caller's record
+                    result = self.generate_instruction(copy.deepcopy(actual_data))
+                logger.debug(f"Code execution results: {result}")
+            except TimeoutException:
+                raise
+            except Exception as e:
+                logger.error(f"Code execution error: {str(e)}")
+                return {
+                    'code': 500,
+                    'success': False,
+                    'error': f"Code execution error: {str(e)}",
+                    'input_data': actual_data
+                }
+
+            # 4. Processing results, formatted as a string only by the API, see format_result_entry
+            stdout_content = output.getvalue()
+
+            return {
+                'code': 200,
+                'success': True,
+                'result': structured_output(result),
+                'stdout': stdout_content,
+                'executed_code': self.executed_code
+            }
+
+        except TimeoutException:
+            raise
+        except Exception as e:
+            error_msg = f"Failed to process data: {str(e)}"
+            logger.error(error_msg)
+            return {
+                'code': 500,
+                'success': False,
+                'error': error_msg,
+                'input_data': input_data
+            }
+
+
+def _error_entry(index: int, data: Any, error: Exception) -> Dict[str, Any]:
+    """Batch entry of a record that could not be processed"""
+    return {
+        "index": index,
+        "input": data,
+        "error": str(error),
+        "error_type": type(error).__name__
+    }
+
+def _run_record(executor: CodeExecutor, index: int, data: Any) -> Dict[str, Any]:
+    """Run one record and wrap it into a batch entry"""
+    try:
+        # Data Validation
+        if not isinstance(data, dict):
+            raise ValueError(f"Data format error: expected dict type, actual{type(data)}")
+
+        return {
+            "index": index,
+            "input": data,
+            "result": executor.run_single(data)
+        }
+    except Exception as e:
+        logger.error(f"Failed to process the {index + 1}th data: {str(e)}")
+        return _error_entry(index, data, e)
+
+
+# Extra seconds the parent waits for a worker before declaring it stuck
+WATCHDOG_GRACE = 2.0
+# Seconds a new worker process may take to import its modules and report ready
+WORKER_START_TIMEOUT = 60.0
+# Interval timers only exist on Unix, elsewhere the parent watchdog alone bounds a batch
+_HAS_ITIMER = hasattr(signal, 'setitimer')
+
+def _alarm_handler(signum, frame):
+    raise TimeoutException("Code execution timeout")
+
+def _arm_timer(seconds: float):
+    """Interrupt the worker after `seconds`, then every 50ms in case the generated code swallows it"""
+    if _HAS_ITIMER:
+        signal.setitimer(signal.ITIMER_REAL, seconds, 0.05)
+
+def _disarm_timer():
+    if _HAS_ITIMER:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _run_records(executor: CodeExecutor, start: int, records: List[Any],
+                 record_timeout: float, time_budget: float) -> List[Dict[str, Any]]:
+    """Worker side of a batch: run every record under its own timer"""
+    deadline = time.monotonic() + time_budget
+    entries = []
+    for offset, data in enumerate(records):
+        index = start + offset
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            entry = _error_entry(index, data, TimeoutException("Batch execution timeout"))
+        else:
+            _arm_timer(min(record_timeout, remaining))
+            try:
+                try:
+                    entry = _run_record(executor, index, data)
+                finally:
+                    _disarm_timer()
+            except TimeoutException as e:
+                # The timer fired between the record and the disarm
+                _disarm_timer()
+                entry = _error_entry(index, data, e)
+        # The parent still holds the records, there is no need to send them back
+        entry.pop('input', None)
+        entries.append(entry)
+    return entries
+
+def _worker_main(conn) -> None:
+    """
+    Sandbox worker process loop
+
+    The worker runs in the main thread of its own process, where SIGALRM can interrupt
+    a single record. Allowed modules and the frozen builtins table are loaded once on
+    import of utils.run_python_utils, before the worker reports ready.
+
+    Messages from the parent:
+        ('load', executed_code, timeout): compile the program used by the following records
+        ('run', start, records, record_timeout, time_budget): run a batch of records and
+            send back their entries in one message
+    """
+    if _HAS_ITIMER:
+        signal.signal(signal.SIGALRM, _alarm_handler)
+    executor = None
+    conn.send('ready')
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == 'load':
+            _arm_timer(message[2])
+            try:
+                executor = CodeExecutor(message[1])
+            finally:
+                _disarm_timer()
+        elif message[0] == 'run':
+            conn.send(_run_records(executor, *message[1:]))
+
+
+class SandboxWorker:
+    """
+    A long-lived worker process executing the generated code in batches of records
+
+    Each record is interrupted inside the worker once it exceeds its budget. The parent
+    also waits for every batch with a wall-clock budget instead of SIGALRM, so it can be
+    driven from any thread: a worker that misses it is killed and replaced.
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.process = None
+        self.conn = None
+        self.loaded_code = None
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.loaded_code = None
+
+    def wait_ready(self):
+        """Block until the new process has imported its modules"""
+        if not self.conn.poll(WORKER_START_TIMEOUT) or self.conn.recv() != 'ready':
+            raise RuntimeError("Sandbox worker failed to start")
+
+    def restart(self):
+        """Kill the (possibly stuck) process and start a new one"""
+        self.stop()
+        self.start()
+        self.wait_ready()
+
+    def run_batch(self, executed_code: str, start: int, records: List[Any],
+                  record_timeout: float, time_budget: float) -> List[Dict[str, Any]]:
+        """Run a batch of records, a record hanging or killing its worker gets an error entry"""
+        deadline = time.monotonic() + time_budget
+        budget = min(record_timeout * len(records), time_budget) + WATCHDOG_GRACE
+        try:
+            if self.loaded_code != executed_code:
+                self.conn.send(('load', executed_code, record_timeout))
+                self.loaded_code = executed_code
+                budget += record_timeout
+            self.conn.send(('run', start, records, record_timeout, time_budget))
+            if self.conn.poll(budget):
+                entries = self.conn.recv()
+                for entry, data in zip(entries, records):
+                    entry['input'] = data
+                return entries
+            error = TimeoutException("Worker stopped responding")
+            logger.error(f"Records {start}-{start + len(records) - 1} exceeded {budget:.1f}s, restarting worker")
+        except (EOFError, OSError) as e:
+            error = RuntimeError("Worker process exited unexpectedly")
+            logger.error(f"Worker process exited while processing records {start}-{start + len(records) - 1}: {str(e)}")
+
+        self.restart()
+        if len(records) == 1:
+            return [_error_entry(start, records[0], error)]
+
+        # Find the offending record by running the batch again one record at a time
+        entries = []
+        for offset, data in enumerate(records):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                entries.append(_error_entry(start + offset, data, TimeoutException("Batch execution timeout")))
+                continue
+            entries.extend(self.run_batch(executed_code, start + offset, [data], record_timeout, remaining))
+        return entries
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Fixed set of sandbox workers shared by all batches of this process"""
+    def __init__(self, size: int, start_method: str):
+        ctx = multiprocessing.get_context(start_method)
+        self.size = size
+        self.idle = queue.Queue()
+        # Start all processes first so they warm up in parallel
+        workers = [SandboxWorker(ctx) for _ in range(size)]
+        for worker in workers:
+            worker.wait_ready()
+            self.idle.put(worker)
+
+    def acquire(self) -> SandboxWorker:
+        return self.idle.get()
+
+    def release(self, worker: SandboxWorker):
+        self.idle.put(worker)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool() -> WorkerPool:
+    """Get the shared worker pool, it is created on first use and kept for later batches"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(max(1, EXECUTOR_WORKERS), EXECUTOR_START_METHOD)
+        return _pool
+
+
+# Errors that depend on the load of the machine rather than on the code and the record
+TRANSIENT_ERRORS = ('TimeoutException', 'RuntimeError')
+# New results are written to the evaluation cache in batches of this size
+CACHE_WRITE_BATCH = 256
+
+def _is_cacheable(entry: Dict[str, Any]) -> bool:
+    return entry.get('error_type') not in TRANSIENT_ERRORS
+
+def _cache_value(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Entry fields stored in the evaluation cache, the record and the code are not repeated"""
+    value = {k: v for k, v in entry.items() if k not in ('index', 'input')}
+    result = value.get('result')
+    if isinstance(result, dict) and 'executed_code' in result:
+        value['result'] = {**result, 'executed_code': None}
+    return value
+
+
+class BatchExecutor:
+    """
+    Run the generated code over a batch of records on a pool of worker processes
+
+    Records are split into contiguous shards, each shard is sent to a warm worker in one
+    message and its results come back in one message, results are always returned in
+    input order. Every record has a wall-clock budget
+    and the whole batch has another one: a record exceeding them gets a
+    TimeoutException entry and the rest of the batch carries on.
+
+    Results are looked up in and added to the persistent evaluation cache, so a record is not
+    run again by the same program, even if it was reformatted or its comments changed.
+    """
+    def __init__(self, executed_code: str, workers: Optional[int] = None, shard_size: Optional[int] = None,
+                 record_timeout: Optional[float] = None, batch_timeout: Optional[float] = None,
+                 use_cache: bool = True):
+        self.executed_code = executed_code
+        self.workers = max(1, workers if workers is not None else EXECUTOR_WORKERS)
+        self.shard_size = max(1, shard_size or EXECUTOR_SHARD_SIZE)
+        self.record_timeout = record_timeout or EXECUTOR_RECORD_TIMEOUT
+        self.batch_timeout = batch_timeout or EXECUTOR_BATCH_TIMEOUT
+        self.use_cache = use_cache and EVAL_CACHE_ENABLED
+
+    def _run_shard(self, pool: WorkerPool, start: int, shard: List[Any], deadline: float,
+                   cancelled: threading.Event) -> List[Dict[str, Any]]:
+        """Run a contiguous shard of records on one worker, as a single IPC batch"""
+        worker = pool.acquire()
+        try:
+            remaining = deadline - time.monotonic()
+            if cancelled.is_set() or remaining <= 0:
+                error = TimeoutException("Batch execution timeout")
+                return [_error_entry(start + offset, data, error) for offset, data in enumerate(shard)]
+            return worker.run_batch(self.executed_code, start, shard, self.record_timeout, remaining)
+        finally:
+            pool.release(worker)
+
+    def iter_results(self, batch_data: List[Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one entry per record, in input order
+
+        Successful entries contain `index`, `input` and `result`,
+        failed entries contain `index`, `input`, `error` and `error_type`.
+        """
+        if not batch_data:
+            return
+        if not self.use_cache:
+            yield from self._iter_executed(batch_data)
+            return
+
+        cache = get_eval_cache()
+        fingerprint = code_fingerprint(self.executed_code)
+        keys = [eval_key(fingerprint, data) for data in batch_data]
+        cached = cache.get_many(keys)
+        missing = [data for data, key in zip(batch_data, keys) if key not in cached]
+        logger.info(f"Evaluation cache: {len(batch_data) - len(missing)} of {len(batch_data)} records cached")
+
+        executed = self._iter_executed(missing)
+        new_results = []
+        try:
+            for index, (data, key) in enumerate(zip(batch_data, keys)):
+                if key in cached:
+                    yield self._cached_entry(index, data, cached[key])
+                    continue
+                entry = next(executed)
+                entry['index'] = index
+                if _is_cacheable(entry):
+                    new_results.append((key, _cache_value(entry)))
+                    if len(new_results) >= CACHE_WRITE_BATCH:
+                        cache.put_many(new_results)
+                        new_results = []
+                yield entry
+        finally:
+            executed.close()
+            cache.put_many(new_results)
+
+    def _cached_entry(self, index: int, data: Any, value: Dict[str, Any]) -> Dict[str, Any]:
+        entry = {'index': index, 'input': data, **value}
+        result = entry.get('result')
+        if isinstance(result, dict) and 'executed_code' in result:
+            entry['result'] = {**result, 'executed_code': self.executed_code}
+        return entry
+
+    def _iter_executed(self, batch_data: List[Any]) -> Iterator[Dict[str, Any]]:
+        """Run the records on the worker pool, see iter_results"""
+        if not batch_data:
+            return
+
+        pool = get_worker_pool()
+        workers = min(self.workers, pool.size)
+        deadline = time.monotonic() + self.batch_timeout
+        cancelled = threading.Event()
+
+        # Spread the records so that every worker gets several shards
+        shard_size = min(self.shard_size, max(1, len(batch_data) // (workers * 4)))
+        dispatcher = ThreadPoolExecutor(max_workers=workers)
+        futures = []
+        for start in range(0, len(batch_data), shard_size):
+            shard = batch_data[start:start + shard_size]
+            futures.append((start, shard, dispatcher.submit(self._run_shard, pool, start, shard, deadline, cancelled)))
+
+        try:
+            for start, shard, future in futures:
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    logger.error(f"Worker failed on records {start}-{start + len(shard) - 1}: {str(e)}")
+                    for offset, data in enumerate(shard):
+                        yield _error_entry(start + offset, data, e)
+        finally:
+            # Stop the remaining shards when the caller stops consuming early
+            cancelled.set()
+            dispatcher.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, batch_data: List[Any]) -> Dict[str, Any]:
+        """
+        Batch data processing
+
+        Returns:
+            Dict containing:
+                - success_results: list of successful processing results
+                - failed_results: failed data and error information
+                - statistics: processing statistics
+        """
+        success_results = []
+        failed_results = []
+        for entry in self.iter_results(batch_data):
+            if 'error' in entry:
+                failed_results.append(entry)
+            else:
+                success_results.append(entry)
+
+        return {
+            "success_results": success_results,
+            "failed_results": failed_results,
+            "statistics": batch_statistics(len(batch_data), len(success_results), len(failed_results))
+        }
+
+
+def batch_statistics(total: int, success_count: int, failure_count: int) -> Dict[str, Any]:
+    """Processing statistics reported by the batch endpoints"""
+    return {
+        "total": total,
+        "success": success_count,
+        "failure": failure_count,
+        "success_rate": f"{(success_count/total)*100:.2f}%" if total else "0.00%"
+    }
+
+
+def format_result_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Batch entry as returned by the API, where the result of the generated code is its formatted string
+
+    The entry gets a new result dict, the one it held is not modified.
+    """
+    result = entry.get('result')
+    if isinstance(result, dict) and 'result' in result:
+        entry['result'] = {**result, 'result': format_output(result['result'])}
+    return entry
+
+
+def execute_batch(executed_code: str, batch_data: List[Any], workers: Optional[int] = None,
+                  use_cache: bool = True) -> Dict[str, Any]:
+    """Run the generated code over all records, see BatchExecutor.run"""
+    return BatchExecutor(executed_code, workers=workers, use_cache=use_cache).run(batch_data)
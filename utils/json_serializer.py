@@ -0,0 +1,163 @@
+import os
+import json
+from typing import Any, Callable, Dict, Iterable, Optional
+from flask.json.provider import DefaultJSONProvider
+from config.settings import JSON_BACKEND, JSON_COMPACT_FILES
+from utils.logger import logger
+
+try:
+    import orjson
+except ImportError:     # The standard library is used instead
+    orjson = None
+
+# JSON encoding of responses and result files. orjson is used when it is installed (and JSON_BACKEND
+# is not 'stdlib'), values it cannot encode, e.g. integers above 64 bits, fall back to the json module.
+
+USE_ORJSON = orjson is not None and JSON_BACKEND != 'stdlib'
+if JSON_BACKEND == 'orjson' and orjson is None:
+    logger.warning("JSON_BACKEND is 'orjson' but orjson is not installed, using the json module")
+
+
+def get_backend() -> str:
+    return 'orjson' if USE_ORJSON else 'stdlib'
+
+def _orjson_dumps(obj: Any, indent: Optional[int], sort_keys: bool, default) -> Optional[bytes]:
+    """Encode with orjson, None when it is not used or cannot encode the value"""
+    if not USE_ORJSON:
+        return None
+    option = 0
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        return orjson.dumps(obj, default=default, option=option)
+    except TypeError:
+        return None
+
+def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False,
+          default: Optional[Callable[[Any], Any]] = None) -> str:
+    """
+    Encode to a JSON string
+
+    Args:
+        obj: value to encode
+        indent: pretty print, orjson always indents by 2 spaces
+        sort_keys: sort the keys of objects
+        default: called for values that cannot be encoded
+
+    Returns:
+        Encoded JSON, compact when indent is not given
+    """
+    encoded = _orjson_dumps(obj, indent, sort_keys, default)
+    if encoded is not None:
+        return encoded.decode('utf-8')
+    separators = None if indent else (',', ':')
+    return json.dumps(obj, ensure_ascii=False, indent=indent, sort_keys=sort_keys, default=default,
+                      separators=separators)
+
+def dumps_bytes(obj: Any, indent: Optional[int] = None, sort_keys: bool = False,
+                default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Encode to UTF-8 JSON, see dumps"""
+    encoded = _orjson_dumps(obj, indent, sort_keys, default)
+    if encoded is not None:
+        return encoded
+    return dumps(obj, indent, sort_keys, default).encode('utf-8')
+
+def loads(data) -> Any:
+    """Decode JSON from str or bytes"""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump(obj: Any, path: str, compact: bool = JSON_COMPACT_FILES, indent: int = 2):
+    """
+    Write a JSON file, replacing it only once it is complete
+
+    Args:
+        obj: value to write
+        path: target file
+        compact: no indentation, for files that are only read by programs
+        indent: indentation of files that are not compact
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps_bytes(obj, indent=None if compact else indent))
+    os.replace(tmp_path, path)
+
+
+class JsonArrayWriter:
+    """
+    Write a JSON array to a file one item at a time
+
+    Every item is on its own line, so the array is never held in memory. With a `key` the
+    array is written as that field of an object, the fields set in `trailer` follow it.
+    The file is replaced once closed, an exception inside the with block leaves it untouched.
+    """
+    def __init__(self, path: str, compact: bool = JSON_COMPACT_FILES, indent: int = 2, key: Optional[str] = None):
+        self.path = path
+        self.indent = None if compact else indent
+        self.key = key
+        self.trailer: Dict[str, Any] = {}
+        self.count = 0
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(b'{' + dumps_bytes(key) + b':[' if key is not None else b'[')
+
+    def encode(self, item: Any) -> bytes:
+        return dumps_bytes(item, indent=self.indent)
+
+    def write(self, item: Any):
+        self.write_encoded(self.encode(item))
+
+    def write_encoded(self, encoded: bytes):
+        """Write an item already encoded by encode()"""
+        self._file.write(b',\n' if self.count else b'\n')
+        self._file.write(encoded)
+        self.count += 1
+
+    def write_many(self, items: Iterable[Any]):
+        for item in items:
+            self.write(item)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(b'\n]' if self.count else b']')
+        if self.key is not None:
+            for name, value in self.trailer.items():
+                self._file.write(b',\n' + dumps_bytes(name) + b':' + dumps_bytes(value, indent=self.indent))
+            self._file.write(b'}')
+        self._file.write(b'\n')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Drop what was written, the target file is left as it was"""
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider for jsonify and request.json on top of the serializer above"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if not USE_ORJSON or set(kwargs) - {'indent', 'separators', 'sort_keys', 'ensure_ascii'}:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, indent=kwargs.get('indent'), sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     default=self.default)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if not USE_ORJSON or kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
@@ -0,0 +1,167 @@
+import os
+import mmap
+import random
+from array import array
+from collections.abc import Sequence
+from typing import Any, Iterator, List, Optional
+from utils.logger import logger
+from utils import json_serializer
+
+# JSONL datasets, one record per line, with a sidecar index of the byte offset of every record
+# (<dataset>.idx). Records are read through a memory map, so opening a dataset does not parse it.
+
+INDEX_SUFFIX = '.idx'
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+def build_index(path: str) -> array:
+    """
+    Byte offsets of the records of a JSONL file, blank lines are skipped
+
+    Returns:
+        Start offset of every record followed by the file size, so record i spans offsets[i]:offsets[i + 1]
+    """
+    offsets = array('Q')
+    size = os.path.getsize(path)
+    if size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                newline = mm.find(b'\n', pos)
+                end = size if newline == -1 else newline + 1
+                if mm[pos:end].strip():
+                    offsets.append(pos)
+                pos = end
+    offsets.append(size)
+    return offsets
+
+def write_index(path: str, offsets: array):
+    target = index_path(path)
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, 'wb') as f:
+        offsets.tofile(f)
+    os.replace(tmp_path, target)
+
+def load_index(path: str) -> array:
+    """Offsets of a JSONL file, the sidecar index is rebuilt when it is missing or older than the file"""
+    target = index_path(path)
+    try:
+        if os.path.getmtime(target) >= os.path.getmtime(path):
+            offsets = array('Q')
+            with open(target, 'rb') as f:
+                offsets.frombytes(f.read())
+            # The last offset is the size of the file when it was indexed
+            if offsets and offsets[-1] == os.path.getsize(path):
+                return offsets
+    except OSError:
+        pass
+
+    offsets = build_index(path)
+    try:
+        write_index(path, offsets)
+    except OSError as e:
+        logger.warning(f"Could not write the index of {path}: {str(e)}")
+    return offsets
+
+
+class JsonlDataset(Sequence):
+    """
+    Read-only, indexed view of a JSONL dataset
+
+    Works wherever a list of records is expected: len(), dataset[i], slices, iteration and
+    random.sample() only parse the records they touch.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = load_index(path)
+        self._file = None
+        self._mm = None
+        if len(self.offsets) > 1:
+            self._file = open(path, 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('dataset index out of range')
+        return self._record(index)
+
+    def _record(self, index: int) -> Any:
+        return json_serializer.loads(self._mm[self.offsets[index]:self.offsets[index + 1]])
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(len(self)):
+            yield self._record(index)
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[List[Any]]:
+        """Consecutive lists of up to `chunk_size` records"""
+        for start in range(0, len(self), chunk_size):
+            yield self[start:start + chunk_size]
+
+    def sample(self, k: int, seed: Optional[int] = None) -> List[Any]:
+        """`k` distinct records chosen at random"""
+        rng = random.Random(seed) if seed is not None else random
+        return [self._record(i) for i in rng.sample(range(len(self)), k)]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"JsonlDataset({self.path!r}, records={len(self)})"
+
+
+def is_jsonl(path: str) -> bool:
+    return path.lower().endswith(('.jsonl', '.ndjson'))
+
+def load_dataset(path: str):
+    """Records of a dataset file, an indexed JsonlDataset for JSONL files and a list for JSON arrays"""
+    if is_jsonl(path):
+        return JsonlDataset(path)
+    with open(path, 'rb') as f:
+        return json_serializer.loads(f.read())
+
+def convert_json_to_jsonl(source: str, target: Optional[str] = None) -> str:
+    """
+    Convert a JSON array dataset to JSONL and write its index
+
+    Args:
+        source: JSON file holding an array of records
+        target: JSONL file, next to the source with a .jsonl extension by default
+
+    Returns:
+        Path of the JSONL file
+    """
+    target = target or os.path.splitext(source)[0] + '.jsonl'
+    with open(source, 'rb') as f:
+        records = json_serializer.loads(f.read())
+    if not isinstance(records, list):
+        raise ValueError(f"{source} does not hold a JSON array")
+
+    offsets = array('Q')
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for record in records:
+            offsets.append(f.tell())
+            f.write(json_serializer.dumps_bytes(record) + b"\n")
+        offsets.append(f.tell())
+    os.replace(tmp_path, target)
+    write_index(target, offsets)
+    logger.info(f"Converted {len(records)} records from {source} to {target}")
+    return target
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Tuple, Dict, Any
+from config.settings import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL
+from utils.logger import logger
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Ignore line ending styles and surrounding whitespace when matching prompts"""
+    return prompt.replace('\r\n', '\n').strip()
+
+def cache_key(provider: str, model_name: str, prompt: str, params: Dict[str, Any]) -> str:
+    """Hash of the provider, model, normalized prompt and sampling parameters"""
+    content = json.dumps([provider, model_name, normalize_prompt(prompt), params],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM responses stored in a local SQLite file
+
+    Entries expire after `ttl` seconds. When the stored responses exceed `max_bytes`,
+    the least recently used entries are evicted. Hits and misses of this process are
+    counted in `hits` and `misses`.
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                token_prompt INTEGER,
+                token_compli INTEGER,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, int, int]]:
+        """Return (response, token_prompt, token_compli) of a fresh entry, or None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT response, token_prompt, token_compli, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and now - row[3] > self.ttl:
+                self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0], row[1], row[2]
+
+    def put(self, key: str, response: str, token_prompt: int, token_compli: int):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, response, token_prompt, token_compli, size, now, now)
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones until the size fits"""
+        self.conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"LLM cache evicted {evicted} entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'size_bytes': size
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -1,15 +1,35 @@
 import time
+import math
+import threading
+from statistics import NormalDist
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+def wilson_interval(successes: int, total: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """Two-sided Wilson score interval of a success rate, (0, 1) when nothing was observed"""
+    if total <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
 
 @dataclass
 class MetricsCollector:
     start_time: float = field(default_factory=time.time)
     total_tokens: Dict[str, int] = field(default_factory=lambda: {"prompt": 0, "completion": 0})
+    cached_tokens: Dict[str, int] = field(default_factory=lambda: {"prompt": 0, "completion": 0})
+    cache_hits: int = 0
+    llm_calls: int = 0
     step_times: Dict[str, float] = field(default_factory=dict)
     iterations: List[Dict] = field(default_factory=list)
     final_accuracy: float = 0.0
     config: Dict = field(default_factory=dict)
+    backend: Dict = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
     
     def start_step(self, step_name: str):
@@ -24,12 +44,20 @@ class MetricsCollector:
             return elapsed
         return 0
     
-    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
-        """Add token count"""
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int, cached: bool = False):
+        """Add token count, responses served from the LLM cache are counted separately"""
         prompt_tokens = int(prompt_tokens) if prompt_tokens is not None else 0
         completion_tokens = int(completion_tokens) if completion_tokens is not None else 0
-        self.total_tokens["prompt"] += prompt_tokens
-        self.total_tokens["completion"] += completion_tokens
+        # Candidates are generated from several threads
+        with self._lock:
+            self.llm_calls += 1
+            if cached:
+                self.cache_hits += 1
+                self.cached_tokens["prompt"] += prompt_tokens
+                self.cached_tokens["completion"] += completion_tokens
+                return
+            self.total_tokens["prompt"] += prompt_tokens
+            self.total_tokens["completion"] += completion_tokens
 
     def set_config(self, args):
         """Record experimental configuration parameters"""
@@ -46,12 +74,19 @@ class MetricsCollector:
                 "max_iterations": args_dict.get("max_iterations", 0),
                 "target_accuracy": args_dict.get("target_accuracy", 0.0),
                 "batch_size": args_dict.get("batch_size", 0),
+                "num_candidates": args_dict.get("num_candidates", 1),
+                "beam_width": args_dict.get("beam_width", 1),
+                "backend": args_dict.get("backend", "http"),
                 "data_path": args_dict.get("total_data_dir", ""),
                 "output_dir": args_dict.get("output_dir", ""),
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             }
         }
     
+    def set_backend_stats(self, stats: Dict):
+        """Record how the service was reached and the time spent in its calls"""
+        self.backend = dict(stats)
+
     def get_total_time(self):
         """Get the total running time"""
         return time.time() - self.start_time
@@ -65,9 +100,14 @@ class MetricsCollector:
                 "total_time": f"{self.get_total_time():.2f}s",
                 "step_times": {k: f"{v:.2f}s" for k, v in self.step_times.items()},
             },
+            "backend_metrics": self.backend,
             "token_metrics": {
                 "total_tokens": self.total_tokens,
                 "total_token_count": total_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_count": sum(self.cached_tokens.values()),
+                "llm_calls": self.llm_calls,
+                "cache_hits": self.cache_hits,
             },
             "iteration_metrics": {
                 "total_iterations": len(self.iterations),
@@ -87,12 +127,15 @@ class MetricsCollector:
         
         return report
     
-    def add_iteration(self, iteration: int, accuracy: float, failed_cases: int):
-        """Record information for each iteration"""
+    def add_iteration(self, iteration: int, accuracy: float, failed_cases: int, candidates: int = 1,
+                      evaluated_records: int = None):
+        """Record information for each iteration, `candidates` is the number of programs evaluated"""
         self.iterations.append({
             "iteration": iteration,
             "accuracy": accuracy,
             "failed_cases": failed_cases,
+            "candidates": candidates,
+            "evaluated_records": evaluated_records,
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
         })
     
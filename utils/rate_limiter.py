@@ -0,0 +1,148 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from config.settings import (LLM_RATE_LIMITS, LLM_MODEL_RATE_LIMITS, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX)
+from utils.logger import logger
+
+CHARS_PER_TOKEN = 4     # Rough estimate used to reserve tokens before the real usage is known
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def backoff_delay(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter, `attempt` starts at 0"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds asked for by the Retry-After (or retry-after-ms) header of a failed API call, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute` units per minute
+
+    Callers reserve units up front and sleep for the returned wait, the level may go negative
+    so later callers queue behind earlier ones instead of racing for the refill.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units, returns the seconds to wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level -= amount
+            wait = -self.level / self.rate if self.level < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def adjust(self, amount: float):
+        """Take (or give back, if negative) units without waiting, e.g. to settle an estimate"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+    def block(self, seconds: float):
+        """Hold back every reservation for `seconds`, e.g. after a 429 answer"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Requests/min and tokens/min limits per provider and per model
+
+    Every call reserves one request and its estimated tokens from the buckets of its provider
+    and, if configured, of its model. The estimate is settled with the real usage afterwards.
+    """
+    def __init__(self, provider_limits: Dict[str, Dict[str, int]] = LLM_RATE_LIMITS,
+                 model_limits: Dict[str, Dict[str, int]] = LLM_MODEL_RATE_LIMITS):
+        self.provider_limits = provider_limits
+        self.model_limits = model_limits
+        self.buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def _buckets(self, provider: str, model_name: str, kind: str) -> List[TokenBucket]:
+        buckets = []
+        for scope, limits in (('provider', self.provider_limits.get(provider, {})),
+                              (model_name, self.model_limits.get(model_name, {}))):
+            limit = limits.get(kind, 0)
+            if not limit:
+                continue
+            key = (provider, scope, kind)
+            with self.lock:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(limit)
+            buckets.append(bucket)
+        return buckets
+
+    def acquire(self, provider: str, model_name: str, tokens: int) -> float:
+        """Wait until a request of about `tokens` tokens is allowed, returns the seconds waited"""
+        wait = 0.0
+        for bucket in self._buckets(provider, model_name, 'rpm'):
+            wait = max(wait, bucket.reserve(1))
+        for bucket in self._buckets(provider, model_name, 'tpm'):
+            wait = max(wait, bucket.reserve(tokens))
+        if wait > 0:
+            logger.info(f"Rate limit of {provider}/{model_name} reached, waiting {wait:.2f}s")
+            time.sleep(wait)
+        return wait
+
+    def settle(self, provider: str, model_name: str, reserved: int, used: int):
+        """Correct the reserved token estimate with the real usage of the request"""
+        if used == reserved:
+            return
+        for bucket in self._buckets(provider, model_name, 'tpm'):
+            bucket.adjust(used - reserved)
+
+    def pause(self, provider: str, model_name: str, seconds: float):
+        """Stop all callers of a model for `seconds` after the provider answered with a rate limit"""
+        for kind in ('rpm', 'tpm'):
+            for bucket in self._buckets(provider, model_name, kind):
+                bucket.block(seconds)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter shared by every api_request caller"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
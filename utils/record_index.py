@@ -0,0 +1,165 @@
+import os
+import json
+import codecs
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from config.settings import RECORD_INDEX_CACHE_SIZE
+from utils.jsonl_dataset import is_jsonl, load_index
+from utils import json_serializer
+from utils.logger import logger
+
+# Byte ranges of the records of a dataset file (JSON array or JSONL), so a page of records can be
+# read and parsed without touching the rest of the file.
+
+SCAN_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+class RecordIndex:
+    def __init__(self, path: str, starts: array, ends: array):
+        self.path = path
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def read(self, offset: int, limit: int) -> List[Any]:
+        """Parse records offset..offset + limit - 1, clipped to the dataset"""
+        stop = min(len(self), offset + limit)
+        if offset >= stop:
+            return []
+        base = self.starts[offset]
+        with open(self.path, 'rb') as f:
+            f.seek(base)
+            block = f.read(self.ends[stop - 1] - base)
+        return [json_serializer.loads(block[self.starts[i] - base:self.ends[i] - base]) for i in range(offset, stop)]
+
+
+def _scan_json_array(path: str) -> Optional[RecordIndex]:
+    """
+    Byte range of every element of a top-level JSON array, None if the file holds something else
+
+    The file is decoded in windows and every element is parsed once by the C decoder to find
+    where it ends, only the current window is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8')()
+    starts, ends = array('Q'), array('Q')
+    with open(path, 'rb') as f:
+        state = {'buf': '', 'eof': False}
+
+        def fill() -> bool:
+            if state['eof']:
+                return False
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            state['eof'] = not chunk
+            state['buf'] += reader.decode(chunk, final=state['eof'])
+            return True
+
+        def skip_whitespace(pos: int) -> int:
+            while True:
+                buf = state['buf']
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return pos
+
+        # buf[mark] is at byte offset mark_byte of the file
+        mark, mark_byte = 0, 0
+        pos = skip_whitespace(0)
+        if state['buf'][pos:pos + 1] == '\ufeff':     # Byte order mark, kept in buf so byte offsets stay exact
+            pos = skip_whitespace(pos + 1)
+        if state['buf'][pos:pos + 1] != '[':
+            return None
+        pos = skip_whitespace(pos + 1)
+        if state['buf'][pos:pos + 1] == ']':
+            return RecordIndex(path, starts, ends)
+
+        while True:
+            buf = state['buf']
+            try:
+                _, end = decoder.raw_decode(buf, pos)
+                # A number at the end of the window may continue in the next one
+                complete = end < len(buf) or state['eof']
+            except json.JSONDecodeError:
+                complete = False
+            if not complete:
+                if not fill():
+                    raise ValueError(f"Invalid JSON array in {path}")
+                continue
+
+            start_byte = mark_byte + len(buf[mark:pos].encode('utf-8'))
+            mark, mark_byte = end, start_byte + len(buf[pos:end].encode('utf-8'))
+            starts.append(start_byte)
+            ends.append(mark_byte)
+
+            pos = skip_whitespace(end)
+            buf = state['buf']
+            if buf[pos:pos + 1] == ']':
+                return RecordIndex(path, starts, ends)
+            if buf[pos:pos + 1] != ',':
+                raise ValueError(f"Invalid JSON array in {path} after record {len(starts)}")
+            pos = skip_whitespace(pos + 1)
+
+            # Drop the records already indexed from the window
+            if pos > SCAN_CHUNK_SIZE:
+                buf = state['buf']
+                mark_byte += len(buf[mark:pos].encode('utf-8'))
+                state['buf'] = buf[pos:]
+                mark = pos = 0
+
+def build_record_index(path: str) -> Optional[RecordIndex]:
+    """Record index of a JSONL or JSON array file, None for JSON files that do not hold an array"""
+    if is_jsonl(path):
+        offsets = load_index(path)
+        return RecordIndex(path, offsets[:-1], offsets[1:])
+    return _scan_json_array(path)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_record_index(path: str) -> Optional[RecordIndex]:
+    """Cached record index of a dataset file, rebuilt when the file changes"""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    index = build_record_index(path)
+    logger.info(f"Indexed {path}: {len(index) if index is not None else 'not an array'}")
+    with _cache_lock:
+        _cache[key] = (version, index)
+        _cache.move_to_end(key)
+        while len(_cache) > RECORD_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+def project(record: Any, fields: List[str]) -> Any:
+    """Keep only the given fields of a dict record, nested fields are written as dotted paths"""
+    if not fields or not isinstance(record, dict):
+        return record
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        value, found = record, True
+        for key in field.split('.'):
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                found = False
+                break
+        if not found:
+            continue
+        target = projected
+        keys = field.split('.')
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return projected
@@ -1,179 +1,148 @@
 
 import sys, os, re, math, datetime, collections
 from io import StringIO
-import signal
 import json
-from functools import wraps
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
 from utils.logger import logger
 
 
 class TimeoutException(Exception):
+    """The generated code exceeded its wall-clock budget"""
     pass
 
-def timeout_handler(signum, frame):
-    raise TimeoutException("Code execution timeout")
-
-# Timeout decorator
-def timeout(seconds):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # Set up the signal handler
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(seconds)
-            try:
-                result = func(*args, **kwargs)
-            finally:
-                # Cancel the alarm
-                signal.alarm(0)
-            return result
-        return wrapper
-    return decorator
-
-def execute_with_timeout(code, timeout=5):
-    """Use thread pool to execute code, support timeout"""
-    output = StringIO()
+class ScopedWriter:
+    """
+    File-like object routing writes to the buffer of the current execution scope
+
+    Each thread opens its own scope with capture(), so several generated programs, or
+    several records of the same program, can print concurrently in one process without
+    touching sys.stdout. Writes outside of any scope go to the `default` buffer.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self.default = StringIO()
+
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        return buffer if buffer is not None else self.default
+
+    def write(self, text):
+        return self._buffer().write(text)
+
+    def flush(self):
+        pass
+
+    @contextmanager
+    def capture(self):
+        """Collect everything written by the current thread inside the block"""
+        previous = getattr(self._local, 'buffer', None)
+        buffer = StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+
+# Modules the generated code may import, loaded once when this module is imported
+ALLOWED_MODULES = MappingProxyType({
+    'json': json,
+    'math': math,
+    'datetime': datetime,
+    'os': os,
+})
 
 def safe_import(name, globals=None, locals=None, fromlist=(), level=0):
     """Safe import function, only allows importing modules in the whitelist"""
-    ALLOWED_MODULES = {
-        'json': __import__('json'),
-        'math': __import__('math'),
-        'datetime': __import__('datetime'),
-        'os': __import__('os'),
-    }
-    if name not in ALLOWED_MODULES:
+    module = ALLOWED_MODULES.get(name)
+    if module is None:
         raise ImportError(f"Module {name} is not allowed")
-    return ALLOWED_MODULES[name]
-
-def run_code(code, output):
-    original_stdout = sys.stdout
-    # Add commonly used data processing libraries
-    safe_modules = {
-        'json': json,
-        'os': os,
-        'sys': sys,
-        're': re,
-        'math': math,
-        'datetime': datetime,
-        'collections': collections,
-    }
-    # Create a secure execution environment
+    return module
+
+# Commonly used data processing libraries exposed to the generated code
+SAFE_MODULES = MappingProxyType({
+    'json': json,
+    'os': os,
+    'sys': sys,
+    're': re,
+    'math': math,
+    'datetime': datetime,
+    'collections': collections,
+})
+
+# Builtins available to the generated code, print is bound per namespace in build_namespace
+SAFE_BUILTINS = MappingProxyType({
+    'len': len,
+    'range': range,
+    'str': str,
+    'int': int,
+    'float': float,
+    'list': list,
+    'dict': dict,
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'bool': bool,
+    'tuple': tuple,
+    'set': set,
+    'enumerate': enumerate,
+    'zip': zip,
+    'round': round,
+    'abs': abs,
+    'all': all,
+    'any': any,
+    'sorted': sorted,
+    'reversed': reversed,
+    'isinstance': isinstance,
+    'type': type,
+    'hasattr': hasattr,       # Other type checking functions that may be needed
+    'getattr': getattr,
+    'setattr': setattr,
+    '__import__': safe_import,  # Add __import__ function
+    'ValueError': ValueError,  # Add common exception classes
+    'TypeError': TypeError,
+    'Exception': Exception,
+    # You can add other required exception classes or models
+    'input_data': {},
+})
+
+def build_namespace(output, module_name='__main__'):
+    """Create a secure execution environment whose print writes to output"""
+    builtins = dict(SAFE_BUILTINS)
+    builtins['print'] = lambda *args, **kwargs: print(*args, **kwargs, file=output)
     namespace = {
-        '__builtins__': {
-            'print': lambda *args, **kwargs: print(*args, **kwargs, file=output),
-            'len': len,
-            'range': range,
-            'str': str,
-            'int': int,
-            'float': float,
-            'list': list,
-            'dict': dict,
-            'sum': sum,
-            'min': min,
-            'max': max,
-            'bool': bool,
-            'tuple': tuple,
-            'set': set,
-            'enumerate': enumerate,
-            'zip': zip,
-            'round': round,
-            'abs': abs,
-            'all': all,
-            'any': any,
-            'sorted': sorted,
-            'reversed': reversed,
-            'isinstance': isinstance,
-            'type': type,
-            'hasattr': hasattr,       # Other type checking functions that may be needed
-            'getattr': getattr,
-            'setattr': setattr,
-            '__import__': safe_import,  # Add __import__ function
-            'ValueError': ValueError,  # Add common exception classes
-            'TypeError': TypeError,
-            'Exception': Exception,
-            # You can add other required exception classes or models
-            'input_data': {},
-        },
-        '__name__': '__main__',
+        '__builtins__': builtins,
+        '__name__': module_name,
         'True': True,
         'False': False,
         'None': None,
     }
-    namespace.update(safe_modules)
-    # Redirect standard output
-    sys.stdout = output
-    try:
-        logger.debug("Starting code execution")
-        logger.debug(f"Code to execute:\n{code}")
-
-        # Compile the code first
-        compiled_code = compile(code, '<string>', 'exec')
-        # Add debugging information
-        exec(compiled_code, namespace)
-        logger.debug("Code executed successfully")
-        
-        # Check if there is a generated instruction function
-        if 'generate_instruction' in namespace:
-            logger.debug("Found generate_instruction function")
-            if 'input_data' in namespace:
-                result = namespace['generate_instruction'](namespace['input_data'])
-                logger.debug(f"Function result: {result}")
-                return result
-            else:
-                logger.warning("input_data not found in namespace")
-                return None
-        else:
-            logger.warning("generate_instruction function not found")
-            # Return all print output
-            return output.getvalue()
-
-    except Exception as e:
-        logger.error(f"Code execution error: {str(e)}")
-        raise Exception(f"Code execution error: {str(e)}")
-    finally:
-        sys.stdout = original_stdout
+    namespace.update(SAFE_MODULES)
+    return namespace
 
-
-def process_markdown_code(markdown_code: str, input_path: str) -> str:
+def load_generate_instruction(code, output):
     """
-    Process the code in markdown format, extract the Python code and add the main execution part
+    Compile and execute the generated module once, return its generate_instruction function
+
+    The module is executed under a non-main name, so the `if __name__ == '__main__'`
+    block of the generated code is skipped and only the definitions are kept.
 
     Args:
-    markdown_code: contains the markdown code string in the format of ```python```
+    code: generated Python code
+    output: stream receiving the print output of the generated code
 
     Returns:
-    Processed Python code string
+    The generate_instruction callable defined by the code
     """
-    # Extract the code between ```python and ```
-    try:
-        # Find the start and end of a code block
-        start_index = markdown_code.find('```python\n') + len('```python\n')
-        end_index = markdown_code.find('```', start_index)
-        
-        if start_index == -1 or end_index == -1:
-            raise ValueError("No valid Python code block found")
-        
-        # Extract code
-        code = markdown_code[start_index:end_index].strip()
-
-        with open(input_path, 'r') as f:
-            input = json.load(f)
-        
-        # Add the main function
-        main_code = f"""\n\n
-if __name__ == '__main__':
-    input_data = {input}
-"""
-        
-        # Combined complete code
-        complete_code = code + main_code
-        
-        return complete_code
-        
-    except Exception as e:
-        return f"Error processing code: {str(e)}"
+    compiled_code = compile(code, '<generated>', 'exec')
+    namespace = build_namespace(output, module_name='__sandbox__')
+    exec(compiled_code, namespace)
 
+    generate_instruction = namespace.get('generate_instruction')
+    if not callable(generate_instruction):
+        raise ValueError("generate_instruction function not found")
+    return generate_instruction
 
 def get_executed_python_code(markdown_code: str) -> str:
     try:
@@ -199,6 +168,35 @@ def format_output(result: dict) -> str:
     else:
         return str(result)
 
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+def _check_json_value(value):
+    """Raise TypeError, as json.dumps would, for values that cannot be encoded"""
+    if isinstance(value, _JSON_SCALARS):
+        return
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, _JSON_SCALARS):
+                raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+            _check_json_value(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _check_json_value(item)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def structured_output(result):
+    """
+    Output results as data, format_output(structured_output(result)) is the formatted string
+
+    Dict results are kept as they are, so callers do not have to parse them back,
+    other results are converted to strings.
+    """
+    if isinstance(result, dict):
+        _check_json_value(result)
+        return result
+    return str(result)
+
 def print_step(step_num: int, message: str):
     """Print step information"""
     print(f"\n{'='*50}")
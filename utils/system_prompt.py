@@ -1,10 +1,26 @@
 import os
 import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from config.settings import *
 from utils.logger import logger
 from utils.prompt_template.directgen_prompt import datagen_1shot_system_prompt
 from utils.prompt_template.codegen_prompt import codegen_1shot_system_prompt
 
+TEMPLATE_TYPES = ('prompt', 'codegen')
+
+
+def content_hash(content: str) -> str:
+    """Short SHA-256 of a text, the same in every process and after a restart"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+
+
+def template_version(templates: Dict[str, str]) -> str:
+    """Content hash of a set of templates, the same in every process and after a restart"""
+    return content_hash(json.dumps(templates, sort_keys=True, ensure_ascii=False))
+
 
 def get_default_templates():
     """Get the default template"""
@@ -14,21 +30,196 @@ def get_default_templates():
     }
 
 
+class TemplateStore:
+    """
+    Templates served from memory: the defaults, overridden by the user templates saved in TEMPLATE_FILE
+
+    The file holds only the user's overrides, so the other types follow the defaults of the running
+    code, and a bounded `history` of the saved revisions of each type, keyed by their content hash.
+    It is read again only when its modification time or size changes, so templates saved by another
+    process are picked up without a restart. `version` is the content hash of the templates being
+    served, so equal versions mean equal templates across processes and restarts.
+    """
+    def __init__(self, path: str = TEMPLATE_FILE, history_size: int = TEMPLATE_HISTORY_SIZE):
+        self.path = path
+        self.history_size = max(1, history_size)
+        self.version = None
+        # Reentrant, restore saves while holding it
+        self.lock = threading.RLock()
+        self._defaults = None
+        self._overrides = {}
+        self._history = {}
+        self._templates = None
+        self._stamp = None
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_user_templates(self) -> Tuple[Dict[str, str], Dict[str, List[Dict[str, Any]]]]:
+        """Overrides and revision history saved in the file"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if not isinstance(saved, dict):
+            raise ValueError(f"{self.path} does not hold a JSON object")
+        overrides = {key: value for key, value in saved.items() if key in TEMPLATE_TYPES and isinstance(value, str)}
+        history = saved.get('history')
+        history = history if isinstance(history, dict) else {}
+        history = {key: [revision for revision in revisions
+                         if isinstance(revision, dict) and isinstance(revision.get('content'), str)]
+                   for key, revisions in history.items() if key in TEMPLATE_TYPES and isinstance(revisions, list)}
+        return overrides, history
+
+    def _refresh(self):
+        """Reload the templates if the file changed since they were read, the caller holds the lock"""
+        stamp = self._file_stamp()
+        if self._templates is not None and stamp == self._stamp:
+            return
+        if self._defaults is None:
+            self._defaults = get_default_templates()
+        overrides, history = {}, {}
+        if stamp is not None:
+            try:
+                overrides, history = self._read_user_templates()
+            except Exception as e:
+                logger.error(f"Error loading user templates: {e}")
+                # Keep serving the last templates read, the file is tried again once it changes
+                if self._templates is not None:
+                    self._stamp = stamp
+                    return
+        self._stamp = stamp
+        self._overrides, self._history = overrides, history
+        self._apply({**self._defaults, **overrides})
+
+    def _apply(self, templates: Dict[str, str]):
+        if templates != self._templates:
+            self._templates = templates
+            self.version = template_version(templates)
+            logger.info(f"Loaded templates version {self.version}")
+
+    def _write(self, overrides: Dict[str, str], history: Dict[str, List[Dict[str, Any]]]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**overrides, 'history': history}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+        self._overrides, self._history = overrides, history
+        self._apply({**self._defaults, **overrides})
+
+    def _add_revision(self, revisions: List[Dict[str, Any]], content: str, saved_at: Optional[float]):
+        """Put a revision first in a history list, dropping an older copy and the oldest beyond the limit"""
+        version = content_hash(content)
+        revisions = [revision for revision in revisions if revision.get('version') != version]
+        revisions.insert(0, {'version': version, 'content': content, 'saved_at': saved_at})
+        return revisions[:self.history_size]
+
+    def get(self) -> Tuple[Dict[str, str], str]:
+        """Current templates by type and their version"""
+        with self.lock:
+            self._refresh()
+            return dict(self._templates), self.version
+
+    def save(self, updates: Dict[str, str]) -> str:
+        """
+        Save user templates
+
+        Args:
+            updates: template text by type, the other types keep their current template. A text equal
+                to the default removes the override, the type then follows the defaults again.
+
+        Returns:
+            Version of the templates including the saved ones
+        """
+        with self.lock:
+            self._refresh()
+            overrides = dict(self._overrides)
+            history = dict(self._history)
+            now = time.time()
+            for key, content in updates.items():
+                revisions = history.get(key, [])
+                # Overrides saved before the history existed become its oldest entry
+                previous = overrides.get(key)
+                if previous is not None and not any(revision.get('version') == content_hash(previous)
+                                                    for revision in revisions):
+                    revisions = revisions + [{'version': content_hash(previous), 'content': previous,
+                                              'saved_at': None}]
+                overrides[key] = content
+                if content != self._defaults.get(key):
+                    revisions = self._add_revision(revisions, content, now)
+                history[key] = revisions[:self.history_size]
+            # Overrides equal to the defaults, including those of files that stored every template,
+            # are dropped so these types follow later changes of the defaults
+            overrides = {key: value for key, value in overrides.items() if value != self._defaults.get(key)}
+            self._write(overrides, history)
+            return self.version
+
+    def history(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Revisions that can be restored, by template type
+
+        Returns:
+            Per type, the saved revisions newest first, then the current default, each with `version`,
+            `content`, `saved_at` (None if unknown), `default` and `current`
+        """
+        with self.lock:
+            self._refresh()
+            result = {}
+            for key in TEMPLATE_TYPES:
+                current = content_hash(self._templates[key])
+                revisions = [{**revision, 'default': False} for revision in self._history.get(key, [])]
+                revisions.append({'version': content_hash(self._defaults[key]), 'content': self._defaults[key],
+                                  'saved_at': None, 'default': True})
+                result[key] = [{**revision, 'current': revision['version'] == current} for revision in revisions]
+            return result
+
+    def restore(self, template_type: str, version: str) -> str:
+        """
+        Serve a revision from the history again, restoring the default version removes the override
+
+        Returns:
+            Version of the templates after the restore
+
+        Raises:
+            KeyError: the type has no revision with this version
+        """
+        with self.lock:
+            self._refresh()
+            if template_type not in TEMPLATE_TYPES:
+                raise KeyError(f"Unknown template type: {template_type}")
+            if version == content_hash(self._defaults[template_type]):
+                content = self._defaults[template_type]
+            else:
+                content = next((revision['content'] for revision in self._history.get(template_type, [])
+                                if revision.get('version') == version), None)
+                if content is None:
+                    raise KeyError(f"No {template_type} template with version {version}")
+            return self.save({template_type: content})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_template_store() -> TemplateStore:
+    """Get the process-wide template store, loaded on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemplateStore()
+        return _store
+
+
 def load_user_templates():
     """Load the user-defined template, or return the default template if none"""
-    try:
-        templates = get_default_templates()
-        return templates
-    
-    except Exception as e:
-        logger.error(f"Error loading user templates: {e}")
-        return get_default_templates()
+    return get_template_store().get()[0]
 
 def save_user_templates(templates):
     """Save user-defined templates"""
     try:
-        with open(TEMPLATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(templates, f, ensure_ascii=False, indent=2)
+        get_template_store().save(templates)
         return True
     except Exception as e:
         logger.error(f"Error saving user templates: {e}")
@@ -0,0 +1,151 @@
+import os
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Any, Optional, Tuple
+from config.settings import (ZIP_INGEST_WORKERS, ZIP_INGEST_SHARD_SIZE, ZIP_INGEST_PARALLEL_MIN,
+                             EXECUTOR_START_METHOD)
+from utils.logger import logger
+from utils import json_serializer
+
+# A zip upload holds one JSON record per file, labelled by the folder it is in: <root>/<gt>/<record>.json
+
+
+def decode_zip_filename(info: zipfile.ZipInfo) -> str:
+    """Member name as written by the archiver, which may use a Chinese code page without saying so"""
+    if info.flag_bits & 0x800:      # Marked as UTF-8, already decoded by zipfile
+        return info.filename
+    raw_bytes = info.filename.encode('cp437')
+    for encoding in ('utf-8', 'gbk', 'gb18030', 'cp936'):
+        try:
+            return raw_bytes.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return info.filename
+
+def is_system_file(filename: str) -> bool:
+    return (filename.startswith('__MACOSX') or
+            filename.startswith('._') or
+            filename.startswith('.') or
+            '.DS_Store' in filename)
+
+def _parse_members(zip_ref: zipfile.ZipFile, members: List[Tuple[str, str, str]]) -> List[Optional[str]]:
+    """
+    Read and parse a shard of JSON members
+
+    Returns:
+        Compact JSON line of each labelled record, None for members that could not be parsed
+    """
+    lines = []
+    for name, real_name, gt in members:
+        try:
+            data = json_serializer.loads(zip_ref.read(name))
+            data['gt'] = gt
+            lines.append(json_serializer.dumps(data))
+        except Exception as e:
+            logger.warning(f"Error processing {real_name}: {str(e)}")
+            lines.append(None)
+    return lines
+
+# Archive opened once by each worker process, reading its central directory is the slow part of opening it
+_worker_zip = None
+
+def _init_worker(zip_path: str):
+    global _worker_zip
+    _worker_zip = zipfile.ZipFile(zip_path, 'r')
+
+def _parse_worker_members(members: List[Tuple[str, str, str]]) -> List[Optional[str]]:
+    return _parse_members(_worker_zip, members)
+
+# Members listed in the upload response, only the JSON ones are records of the dataset
+LISTED_EXTENSIONS = ('.json', '.xml', '.txt')
+
+def list_members(zip_ref: zipfile.ZipFile) -> List[Tuple[str, str, str]]:
+    """(member name, decoded name, gt label) of every labelled member with a listed extension, in archive order"""
+    members = []
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        real_name = decode_zip_filename(info)
+        if is_system_file(real_name) or not real_name.lower().endswith(LISTED_EXTENSIONS):
+            continue
+        parts = real_name.split('/')
+        if len(parts) < 2:
+            logger.warning(f"Skipping {real_name}, it is not in a label folder")
+            continue
+        members.append((info.filename, real_name, parts[1]))
+    return members
+
+def _write_merged(output_path: str, shards, results) -> set:
+    """
+    Write the parsed shards, in order, as a JSON array with one record per line
+
+    Returns:
+        Member names of the records written
+    """
+    merged = set()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for shard, lines in zip(shards, results):
+                for (name, real_name, gt), line in zip(shard, lines):
+                    if line is None:
+                        continue
+                    f.write(',\n' if merged else '\n')
+                    f.write(line)
+                    merged.add(name)
+            f.write('\n]\n' if merged else ']\n')
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return merged
+
+def ingest_zip(zip_path: str, output_path: str, workers: int = ZIP_INGEST_WORKERS,
+               shard_size: int = ZIP_INGEST_SHARD_SIZE) -> List[Dict[str, Any]]:
+    """
+    Parse the JSON records of a zip upload and write them as one JSON array
+
+    Members are read straight from the archive without being extracted. Large archives are
+    split in shards parsed by a process pool, the merged file is written once, one record per line.
+
+    Args:
+        zip_path: uploaded archive
+        output_path: merged dataset file
+        workers: parser processes, 1 parses in this process
+        shard_size: members parsed by a worker in one task
+
+    Returns:
+        Name, relative path and label of every merged JSON record and of the .xml and .txt
+        members, which are listed but not merged, in archive order
+    """
+    zip_ref = zipfile.ZipFile(zip_path, 'r')
+    pool = None
+    try:
+        listed = list_members(zip_ref)
+        members = [member for member in listed if member[1].lower().endswith('.json')]
+        shards = [members[i:i + shard_size] for i in range(0, len(members), shard_size)]
+
+        if workers > 1 and len(members) >= ZIP_INGEST_PARALLEL_MIN:
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(shards)),
+                                       mp_context=multiprocessing.get_context(EXECUTOR_START_METHOD),
+                                       initializer=_init_worker, initargs=(zip_path,))
+            results = pool.map(_parse_worker_members, shards)
+        else:
+            results = map(_parse_members, repeat(zip_ref), shards)
+
+        merged = _write_merged(output_path, shards, results)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        zip_ref.close()
+
+    logger.info(f"Merged {len(merged)} of {len(members)} JSON records from {zip_path} into {output_path}")
+    return [{
+        'name': real_name,
+        'relative_path': real_name,
+        'gt': gt,
+    } for name, real_name, gt in listed if name in merged or not real_name.lower().endswith('.json')]